@@ -3,16 +3,23 @@ This is the main entry point for the agent.
 It defines the workflow graph, state, tools, nodes and edges.
 """
 
-from typing import Any, List
+import json
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List
 from typing_extensions import Literal
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, BaseMessage
+import pytz
+from langchain_core.messages import SystemMessage, BaseMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
-from langchain.tools import tool
+from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 from langgraph.types import Command
 from langgraph.graph import MessagesState
-from langgraph.prebuilt import ToolNode
+from models import get_chat_model, get_tool_schema
+from state_delta import omit_unchanged
+from tool_results import collapse_tool_results, register_tool_result, tool_payload, tool_result
 
 class AgentState(MessagesState):
     """
@@ -24,8 +31,8 @@ class AgentState(MessagesState):
     """
     proverbs: List[str] = []
     tools: List[Any]
-    # Weather state
-    weather_data: dict = None
+    # Weather state: the latest report of every location asked about, keyed by location
+    weather_data: Dict[str, dict] = None
     # HITL (Human-in-the-Loop) state
     hitl_pending: bool = False
     hitl_question: str = ""
@@ -33,22 +40,151 @@ class AgentState(MessagesState):
     hitl_context: str = ""
     # your_custom_agent_state: str = ""
 
-@tool
-def get_weather(location: str):
+# Match the outermost JSON array / object in a model response
+JSON_ARRAY_PATTERN = re.compile(r'\[\s*\{.*\}\s*\]', re.DOTALL)
+JSON_OBJECT_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+
+# Timezone abbreviations the model commonly passes to get_time
+TIMEZONE_ALIASES = {
+    "UTC": "UTC",
+    "GMT": "UTC",
+    "EST": "America/New_York",
+    "EDT": "America/New_York",
+    "PST": "America/Los_Angeles",
+    "PDT": "America/Los_Angeles",
+    "CST": "America/Chicago",
+    "CDT": "America/Chicago",
+}
+
+# Fields of a weather report, with the values used when the model leaves one out
+WEATHER_DEFAULTS = {
+    "location": "",
+    "temperature": "N/A",
+    "condition": "Unknown",
+    "humidity": "N/A",
+    "wind_speed": "N/A",
+    "wind_direction": "",
+    "feels_like": "N/A",
+    "visibility": "",
+    "uv_index": "",
+    "precipitation_chance": "",
+    "recommendations": [],
+    "clothing_suggestion": "Dress appropriately for the weather",
+    "activity_suggestion": "Enjoy outdoor activities",
+}
+
+
+def normalize_weather(weather_json: Any, location: str) -> dict:
     """
-    Get detailed weather information for a given location using OpenAI. Returns comprehensive weather data including temperature, conditions, humidity, wind, and recommendations.
+    Return a weather report with every field of WEATHER_DEFAULTS, in that order.
+    """
+    if not isinstance(weather_json, dict):
+        weather_json = {}
+    report = {field: weather_json.get(field, default) for field, default in WEATHER_DEFAULTS.items()}
+    report["location"] = report["location"] or location
+    return report
+
+
+def format_weather_report(report: dict) -> str:
+    """
+    Render a weather report as Markdown for the chat.
+    """
+    return f"""🌤️ **Weather Report for {report['location']}**
+
+**Current Conditions:** {report['condition']}
+**Temperature:** {report['temperature']} (Feels like {report['feels_like']})
+**Humidity:** {report['humidity']}
+**Wind:** {report['wind_speed']} {report['wind_direction']}
+**Visibility:** {report['visibility']}
+**UV Index:** {report['uv_index']}
+**Precipitation Chance:** {report['precipitation_chance']}
+
+**💡 Recommendations:**
+{chr(10).join([f"• {rec}" for rec in report['recommendations']])}
+
+**👕 Clothing:** {report['clothing_suggestion']}
+**🎯 Activities:** {report['activity_suggestion']}"""
+
+
+# Keys of the get_weather payload kept in the history, by report field
+WEATHER_PAYLOAD_KEYS = {
+    "location": "loc",
+    "temperature": "temp",
+    "condition": "cond",
+    "humidity": "hum",
+    "wind_speed": "wind",
+    "wind_direction": "wind_dir",
+    "feels_like": "feels",
+    "visibility": "vis",
+    "uv_index": "uv",
+    "precipitation_chance": "precip",
+    "recommendations": "tips",
+    "clothing_suggestion": "clothing",
+    "activity_suggestion": "activity",
+}
+
+
+def weather_payload(reports: List[dict]) -> str:
+    """
+    Canonical get_weather payload: short keys, and no field left at its default.
+    """
+    return tool_payload([
+        {
+            key: report[field] for field, key in WEATHER_PAYLOAD_KEYS.items()
+            if report.get(field, WEATHER_DEFAULTS[field]) != WEATHER_DEFAULTS[field]
+        }
+        for report in reports
+    ])
+
+
+def expand_weather_payload(payload: Any) -> List[dict]:
+    """
+    Normalized weather reports of a get_weather payload.
+    """
+    items = payload if isinstance(payload, list) else [payload]
+    return [
+        normalize_weather({field: item[key] for field, key in WEATHER_PAYLOAD_KEYS.items() if key in item}, "")
+        for item in items if isinstance(item, dict)
+    ]
+
+
+def render_weather_reports(payload: Any) -> str:
+    """
+    Render a get_weather payload as Markdown for the chat.
+    """
+    return "\n\n".join(format_weather_report(report) for report in expand_weather_payload(payload))
+
+
+def summarize_weather_reports(payload: Any) -> str:
+    """
+    One line standing in for an old get_weather result in the history.
+    """
+    return "Weather reported for " + "; ".join(
+        f"{report['location']}: {report['temperature']}, {report['condition']}"
+        for report in expand_weather_payload(payload)
+    )
+
+
+# Weather reports are kept as JSON in the history, and rendered only for the chat (see tool_results.py)
+register_tool_result("get_weather", render_weather_reports, summarize_weather_reports)
+
+
+async def fetch_weather(locations: List[str]) -> List[dict]:
+    """
+    Generate the weather reports of all locations with a single model call.
+    Returns one normalized report per location, in the same order.
     """
-    from langchain_openai import ChatOpenAI
-    import json
-    
     # Initialize OpenAI model
-    model = ChatOpenAI(model="gpt-4o", temperature=0.3)
-    
+    model = get_chat_model("gpt-4o", temperature=0.3)
+
     # Create a prompt for weather generation
-    prompt = f"""Generate realistic weather information for {location}. Please provide the following information in JSON format:
+    prompt = f"""Generate realistic weather information for each of these locations:
+{json.dumps(locations)}
+
+Please provide a JSON array with one object per location, in the same order, each in this format:
 
 {{
-    "location": "{location}",
+    "location": "City name",
     "temperature": "XX°F/°C",
     "condition": "Sunny/Cloudy/Rainy/etc",
     "humidity": "XX%",
@@ -64,58 +200,33 @@ def get_weather(location: str):
 }}
 
 Make the weather data realistic and location-appropriate. Include helpful recommendations for the user."""
-    
+
+    weather_list: List[Any] = []
     try:
-        # Generate weather using OpenAI
-        response = model.invoke(prompt)
-        weather_text = response.content
-        
-        # Try to extract JSON from the response
-        import re
-        json_match = re.search(r'\{.*\}', weather_text, re.DOTALL)
+        # Generate weather using OpenAI, awaited so a cancelled run stops the request
+        response = await model.ainvoke(prompt)
+
+        # Try to extract the JSON array (or a single object) from the response
+        json_match = JSON_ARRAY_PATTERN.search(response.content) or JSON_OBJECT_PATTERN.search(response.content)
         if json_match:
-            weather_json = json.loads(json_match.group())
-            
-            # Format the response
-            formatted_response = f"""🌤️ **Weather Report for {weather_json.get('location', location)}**
-
-**Current Conditions:** {weather_json.get('condition', 'Unknown')}
-**Temperature:** {weather_json.get('temperature', 'N/A')} (Feels like {weather_json.get('feels_like', 'N/A')})
-**Humidity:** {weather_json.get('humidity', 'N/A')}
-**Wind:** {weather_json.get('wind_speed', 'N/A')} {weather_json.get('wind_direction', '')}
-**Visibility:** {weather_json.get('visibility', 'N/A')}
-**UV Index:** {weather_json.get('uv_index', 'N/A')}
-**Precipitation Chance:** {weather_json.get('precipitation_chance', 'N/A')}
+            parsed = json.loads(json_match.group())
+            weather_list = parsed if isinstance(parsed, list) else [parsed]
+    except Exception: # pylint: disable=broad-except
+        # Fall back to reports with unknown values if OpenAI fails
+        weather_list = []
 
-**💡 Recommendations:**
-{chr(10).join([f"• {rec}" for rec in weather_json.get('recommendations', [])])}
+    return [
+        normalize_weather(weather_list[index] if index < len(weather_list) else None, location)
+        for index, location in enumerate(locations)
+    ]
 
-**👕 Clothing:** {weather_json.get('clothing_suggestion', 'Dress appropriately for the weather')}
-**🎯 Activities:** {weather_json.get('activity_suggestion', 'Enjoy outdoor activities')}"""
-            
-            return formatted_response, weather_json
-        else:
-            # Fallback if JSON parsing fails
-            return weather_text, {
-                "location": location,
-                "temperature": "72°F",
-                "condition": "Sunny",
-                "humidity": "45%",
-                "wind_speed": "5 mph",
-                "feels_like": "75°F"
-            }
-            
-    except Exception as e:
-        # Fallback response if OpenAI fails
-        return f"I apologize, but I encountered an error getting weather information for {location}. Please try again.", {
-            "location": location,
-            "temperature": "Unknown",
-            "condition": "Unknown",
-            "humidity": "Unknown",
-            "wind_speed": "Unknown",
-            "feels_like": "Unknown"
-        }
 
+@tool(response_format="content_and_artifact")
+async def get_weather(locations: List[str]):
+    """
+    Get detailed weather information for one or more locations using OpenAI. Pass every location the user asks about in a single call. Returns comprehensive weather data for each location including temperature, conditions, humidity, wind, and recommendations.
+    """
+    return tool_result("get_weather", weather_payload(await fetch_weather(locations)))
 
 
 @tool
@@ -124,20 +235,8 @@ def get_time(timezone: str = "UTC"):
     Get the current time for a given timezone. Defaults to UTC if no timezone is specified.
     Common timezones: UTC, EST, PST, GMT, Europe/London, America/New_York, etc.
     """
-    from datetime import datetime
-    import pytz
-    
     try:
-        if timezone.upper() in ['UTC', 'GMT']:
-            tz = pytz.UTC
-        elif timezone.upper() in ['EST', 'EDT']:
-            tz = pytz.timezone('America/New_York')
-        elif timezone.upper() in ['PST', 'PDT']:
-            tz = pytz.timezone('America/Los_Angeles')
-        elif timezone.upper() in ['CST', 'CDT']:
-            tz = pytz.timezone('America/Chicago')
-        else:
-            tz = pytz.timezone(timezone)
+        tz = pytz.timezone(TIMEZONE_ALIASES.get(timezone.upper(), timezone))
         
         current_time = datetime.now(tz)
         formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S %Z")
@@ -196,13 +295,13 @@ async def chat_node(state: AgentState, config: RunnableConfig) -> Command[Litera
     """
 
     # 1. Define the model
-    model = ChatOpenAI(model="gpt-4o")
+    model = get_chat_model("gpt-4o")
 
     # 2. Bind the tools to the model
     model_with_tools = model.bind_tools(
         [
             *state.get("tools", []), # bind tools defined by ag-ui
-            *backend_tools,
+            *[get_tool_schema(backend_tool) for backend_tool in backend_tools],
             # your_tool_here
         ],
 
@@ -223,10 +322,15 @@ You have access to several tools:
 - provide_human_response: Provide responses to human input requests"""
     )
 
-    # 4. Run the model to generate a response
+    # 4. Replace old tool results by their summary, if enabled, in the prompt and in the state
+    collapsed = collapse_tool_results(state["messages"])
+    replaced = {message.id: message for message in collapsed}
+    messages = [replaced.get(message.id, message) for message in state["messages"]] if replaced else state["messages"]
+
+    # 5. Run the model to generate a response
     response = await model_with_tools.ainvoke([
         system_message,
-        *state["messages"],
+        *messages,
     ], config)
 
     # Check for HITL requests first
@@ -235,7 +339,7 @@ You have access to several tools:
         return Command(
             goto="hitl_node",
             update={
-                "messages": [response],
+                "messages": [*collapsed, response],
             }
         )
     
@@ -245,7 +349,7 @@ You have access to several tools:
         return Command(
             goto="weather_tool_node",
             update={
-                "messages": [response],
+                "messages": [*collapsed, response],
             }
         )
     
@@ -255,15 +359,15 @@ You have access to several tools:
         return Command(
             goto="tool_node",
             update={
-                "messages": [response],
+                "messages": [*collapsed, response],
             }
         )
 
-    # 5. We've handled all tool calls, so we can end the graph.
+    # 6. We've handled all tool calls, so we can end the graph.
     return Command(
         goto=END,
         update={
-            "messages": [response],
+            "messages": [*collapsed, response],
         }
     )
 
@@ -354,89 +458,109 @@ async def hitl_node(state: AgentState, config: RunnableConfig) -> Command[Litera
     return Command(goto="chat_node")
 
 
+def weather_call_locations(args: Dict[str, Any]) -> List[str]:
+    """
+    Locations of a get_weather call. Without strict function calling, the model
+    may pass a single `location`, or `locations` as a bare string.
+    """
+    locations = args.get("locations") or args.get("location", "")
+    return [locations] if isinstance(locations, str) else list(locations)
+
+
+def weather_by_location(weather_data: Any) -> Dict[str, dict]:
+    """
+    The weather state as reports keyed by location. Threads checkpointed
+    before several locations were supported hold a single flat report.
+    """
+    if not isinstance(weather_data, dict):
+        return {}
+    if isinstance(weather_data.get("location"), str):
+        return {weather_data["location"]: normalize_weather(weather_data, weather_data["location"])}
+    return {location: report for location, report in weather_data.items() if isinstance(report, dict)}
+
+
 async def weather_tool_node(state: AgentState, config: RunnableConfig) -> Command[Literal["chat_node"]]:
     """
     Custom tool node that handles weather tool calls and updates the shared state.
+    The locations of all weather tool calls are resolved with a single model call.
     """
-    from langchain_core.messages import ToolMessage
-    
     # Get the last message which should contain tool calls
     last_message = state["messages"][-1]
-    tool_calls = getattr(last_message, "tool_calls", [])
-    
+    weather_calls = [
+        tool_call for tool_call in getattr(last_message, "tool_calls", [])
+        if tool_call["name"] == "get_weather"
+    ]
+
+    # Locations asked for by each call, accepting the older single-location form
+    call_locations = [weather_call_locations(tool_call["args"]) for tool_call in weather_calls]
+    locations = list(dict.fromkeys(location for locations in call_locations for location in locations))
+    reports = dict(zip(locations, await fetch_weather(locations))) if locations else {}
+
+    # One tool message per call, with the reports of its locations (compact JSON under the AG-UI endpoint)
     tool_messages = []
-    weather_data = None
-    
-    for tool_call in tool_calls:
-        if tool_call["name"] == "get_weather":
-            # Execute the weather tool
-            location = tool_call["args"]["location"]
-            result = get_weather(location)
-            
-            # The get_weather function now returns a tuple (response, weather_data)
-            if isinstance(result, tuple) and len(result) == 2:
-                response_text, weather_data = result
-                # Ensure all required fields have default values
-                weather_data = {
-                    "location": weather_data.get("location", location),
-                    "temperature": weather_data.get("temperature", "N/A"),
-                    "condition": weather_data.get("condition", "Unknown"),
-                    "humidity": weather_data.get("humidity", "N/A"),
-                    "wind_speed": weather_data.get("wind_speed", "N/A"),
-                    "wind_direction": weather_data.get("wind_direction", ""),
-                    "feels_like": weather_data.get("feels_like", "N/A"),
-                    "visibility": weather_data.get("visibility", ""),
-                    "uv_index": weather_data.get("uv_index", ""),
-                    "precipitation_chance": weather_data.get("precipitation_chance", ""),
-                    "recommendations": weather_data.get("recommendations", []),
-                    "clothing_suggestion": weather_data.get("clothing_suggestion", "Dress appropriately for the weather"),
-                    "activity_suggestion": weather_data.get("activity_suggestion", "Enjoy outdoor activities")
-                }
-            else:
-                response_text = str(result)
-                weather_data = {
-                    "location": location,
-                    "temperature": "N/A",
-                    "condition": "Unknown",
-                    "humidity": "N/A",
-                    "wind_speed": "N/A",
-                    "wind_direction": "",
-                    "feels_like": "N/A",
-                    "visibility": "",
-                    "uv_index": "",
-                    "precipitation_chance": "",
-                    "recommendations": [],
-                    "clothing_suggestion": "Dress appropriately for the weather",
-                    "activity_suggestion": "Enjoy outdoor activities"
-                }
-            
-            # Create tool message
-            tool_message = ToolMessage(
-                content=response_text,
-                tool_call_id=tool_call["id"]
-            )
-            tool_messages.append(tool_message)
-    
-    # Update state with weather data and tool messages
+    for tool_call, locations in zip(weather_calls, call_locations):
+        content, artifact = tool_result("get_weather", weather_payload([reports[location] for location in locations]))
+        tool_messages.append(ToolMessage(
+            content=content,
+            artifact=artifact,
+            name="get_weather",
+            tool_call_id=tool_call["id"]
+        ))
+
+    # Update state with the new tool messages and the weather by location, if it changed
     update_data = {
-        "messages": [*state["messages"], *tool_messages]
+        "messages": tool_messages
     }
-    
-    if weather_data:
-        update_data["weather_data"] = weather_data
-    
+
+    if reports:
+        weather_data = {**weather_by_location(state.get("weather_data")), **reports}
+        update_data.update(omit_unchanged(state, {"weather_data": weather_data}))
+
     return Command(goto="chat_node", update=update_data)
 
 
-# Define the workflow graph
-workflow = StateGraph(AgentState)
-workflow.add_node("chat_node", chat_node)
-workflow.add_node("tool_node", ToolNode(tools=backend_tools))
-workflow.add_node("weather_tool_node", weather_tool_node)
-workflow.add_node("hitl_node", hitl_node)
-workflow.add_edge("tool_node", "chat_node")
-workflow.add_edge("weather_tool_node", "chat_node")
-workflow.add_edge("hitl_node", "chat_node")
-workflow.set_entry_point("chat_node")
+def build_graph():
+    """
+    Build and compile the workflow graph.
+    """
+    from langgraph.prebuilt import ToolNode
+
+    # Define the workflow graph
+    workflow = StateGraph(AgentState)
+    workflow.add_node("chat_node", chat_node)
+    workflow.add_node("tool_node", ToolNode(tools=backend_tools))
+    workflow.add_node("weather_tool_node", weather_tool_node)
+    workflow.add_node("hitl_node", hitl_node)
+    workflow.add_edge("tool_node", "chat_node")
+    workflow.add_edge("weather_tool_node", "chat_node")
+    workflow.add_edge("hitl_node", "chat_node")
+    workflow.set_entry_point("chat_node")
+
+    # Conditionally use a checkpointer based on the environment
+    is_fast_api = os.environ.get("LANGGRAPH_FAST_API", "false").lower() == "true"
+
+    if is_fast_api:
+        # When served outside of LangGraph API (e.g. server.py), keep checkpoints in memory
+        from thread_memory import ThreadMemorySaver
+        from checkpoint_serde import CompactSerializer
+        return workflow.compile(checkpointer=ThreadMemorySaver(serde=CompactSerializer(), name=__name__))
+    # When running in LangGraph API/dev, don't use a custom checkpointer
+    return workflow.compile()
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    """
+    Return the compiled graph, compiling it on first use.
+    This is the entry point referenced by langgraph.json.
+    Runs can be profiled on demand, see profiling.py.
+    """
+    from profiling import instrument
+    return instrument(build_graph())
+
 
-graph = workflow.compile()
+def __getattr__(name: str):
+    # Keep `agent.graph` working for callers that import the compiled graph directly
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
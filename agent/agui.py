@@ -0,0 +1,153 @@
+"""
+AG-UI integration for serving the graphs from Python.
+"""
+
+import asyncio
+import copy
+import json
+import os
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from ag_ui.core import AssistantMessage, EventType, RunAgentInput, StateDeltaEvent, ToolMessage
+from ag_ui.encoder import EventEncoder
+from ag_ui_langgraph import LangGraphAgent
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from langgraph.pregel import Pregel
+from cancellation import InFlightCalls, cancel_run
+from state_delta import compute_state_delta
+from tool_results import render_tool_result
+
+# End of a run in the event queue between the run task and the response
+_RUN_FINISHED = object()
+
+# Send the LangGraph events behind the AG-UI events: RAW events and the
+# `rawEvent` field, which repeat node outputs and state. Only for debugging
+RAW_EVENTS = os.environ.get("AGENT_AGUI_RAW_EVENTS", "false").lower() == "true"
+
+
+class DeltaLangGraphAgent(LangGraphAgent):
+    """
+    LangGraph AG-UI agent that replaces STATE_SNAPSHOT events with STATE_DELTA
+    events against the state the client already holds.
+
+    The baseline is the state sent by the client with the run input, then the
+    last state sent during the run. Unchanged states are not sent at all, and a
+    snapshot is kept whenever the patch would be larger than the snapshot itself.
+
+    Tool results are rendered for the chat on the way out (see tool_results.py),
+    the graph state keeps their compact form.
+
+    RAW events and the `rawEvent` of the other events are left out unless
+    AGENT_AGUI_RAW_EVENTS=true: they carry the LangGraph events behind them,
+    with full node inputs and outputs, and make up most of the bytes of a run.
+    """
+
+    def _dispatch_event(self, event: Any) -> Any:
+        if not RAW_EVENTS:
+            if event.type == EventType.RAW:
+                # Dropped in _handle_stream_events, so not worth making JSON-safe
+                return event
+            event.raw_event = None
+        return super()._dispatch_event(event)
+
+    async def _handle_stream_events(self, input: RunAgentInput) -> AsyncGenerator[Any, None]: # pylint: disable=redefined-builtin
+        # The run input carries the client state as plain JSON, copied since
+        # the base agent merges the graph state into it
+        last_sent: Optional[Dict[str, Any]] = copy.deepcopy(input.state) or None
+        # Tool name by tool call id, to pick the renderer of each result
+        tool_names: Dict[str, str] = {}
+
+        async for event in super()._handle_stream_events(input):
+            event_type = getattr(event, "type", None)
+            if event_type == EventType.RAW and not RAW_EVENTS:
+                continue
+            if event_type == EventType.TOOL_CALL_START:
+                tool_names[event.tool_call_id] = event.tool_call_name
+            elif event_type == EventType.TOOL_CALL_RESULT:
+                event = event.model_copy(update={
+                    "content": render_tool_result(tool_names.get(event.tool_call_id), event.content),
+                })
+            elif event_type == EventType.MESSAGES_SNAPSHOT:
+                event = event.model_copy(update={"messages": render_tool_messages(event.messages)})
+            if event_type != EventType.STATE_SNAPSHOT:
+                yield event
+                continue
+
+            # Diff the snapshot exactly as the client would receive it
+            snapshot = event.model_dump(mode="json")["snapshot"]
+            if last_sent is None:
+                last_sent = snapshot
+                yield event
+                continue
+
+            delta = compute_state_delta(last_sent, snapshot)
+            if not delta:
+                continue
+
+            last_sent = snapshot
+            if len(json.dumps(delta)) >= len(json.dumps(snapshot)):
+                yield event
+            else:
+                yield StateDeltaEvent(type=EventType.STATE_DELTA, delta=delta)
+
+
+def render_tool_messages(messages: List[Any]) -> List[Any]:
+    """
+    Copy of AG-UI `messages` with the tool results rendered for the chat.
+    """
+    tool_names = {
+        call.id: call.function.name
+        for message in messages if isinstance(message, AssistantMessage)
+        for call in message.tool_calls or []
+    }
+    return [
+        message.model_copy(update={"content": render_tool_result(tool_names.get(message.tool_call_id), message.content)})
+        if isinstance(message, ToolMessage) else message
+        for message in messages
+    ]
+
+
+def add_agent_endpoint(app: FastAPI, name: str, graph: Pregel, path: str) -> None:
+    """
+    Serve a graph over AG-UI at `path`.
+
+    Unlike `add_langgraph_fastapi_endpoint`, every run gets its own agent
+    instance: `LangGraphAgent` keeps per-run bookkeeping on the instance, so
+    sharing one between concurrent runs mixes up their events.
+
+    The run executes in its own task, which is cancelled as soon as the
+    client disconnects or aborts the run (see cancellation.py). Setting
+    `forwardedProps.profile` profiles the run (see profiling.py).
+    """
+
+    @app.post(path, name=name)
+    async def run_agent(input_data: RunAgentInput, request: Request):
+        calls = InFlightCalls()
+        config: Dict[str, Any] = {"callbacks": [calls]}
+        if (input_data.forwarded_props or {}).get("profile"):
+            config["metadata"] = {"profile": True}
+        agent = DeltaLangGraphAgent(name=name, graph=graph, config=config)
+        encoder = EventEncoder(accept=request.headers.get("accept"))
+
+        async def event_generator():
+            events: asyncio.Queue = asyncio.Queue()
+
+            async def produce():
+                try:
+                    async for event in agent.run(input_data):
+                        events.put_nowait(event)
+                finally:
+                    events.put_nowait(_RUN_FINISHED)
+
+            run = asyncio.create_task(produce())
+            try:
+                while (event := await events.get()) is not _RUN_FINISHED:
+                    yield encoder.encode(event)
+                # Surface the errors of the run
+                await run
+            finally:
+                # The response was cancelled or closed before the run finished
+                if not run.done():
+                    cancel_run(run, calls, graph, input_data.thread_id)
+
+        return StreamingResponse(event_generator(), media_type=encoder.get_content_type())
@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for the agent graphs.
+
+Run them from the `agent` directory, e.g. `python -m benchmarks.import_time`.
+"""
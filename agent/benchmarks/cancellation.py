@@ -0,0 +1,187 @@
+"""
+How quickly a client disconnect aborts the upstream model request.
+
+Serves the graphs like a server.py worker, with a stub model that takes
+`--latency` seconds per call and records when a call is cancelled. For each
+scenario, a client starts an AG-UI run, disconnects while a given model call
+is in flight, and the delay until that call is cancelled is measured. The
+thread's checkpoint must be left with no pending nodes, or still waiting on
+its interrupt. Exits with status 1 if a delay exceeds `--max-delay`.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.cancellation [--latency 2] [--max-delay 0.5] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional
+import httpx
+import uvicorn
+from fake_models import ScenarioChatModel
+
+# Times at which model calls were cancelled
+cancelled_at: List[float] = []
+
+
+class CancellationProbe(ScenarioChatModel):
+    """
+    Scenario model that records when its calls are cancelled.
+    """
+
+    async def _agenerate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        try:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        except asyncio.CancelledError:
+            cancelled_at.append(time.perf_counter())
+            raise
+
+
+class Cut(NamedTuple):
+    """
+    Disconnect `after` model-call latencies into the run, which follows the
+    interrupt of a first run when `resume` is set.
+    """
+    graph_id: str
+    prompt: str
+    resume: Optional[str]
+    after: float
+
+
+SCENARIOS: Dict[str, Cut] = {
+    # First model call of the run
+    "chat_node": Cut("sample_agent", "What's the weather in Paris?", None, 0.5),
+    # Second model call, made by the tool
+    "get_weather": Cut("sample_agent", "What's the weather in Paris?", None, 1.5),
+    # The gpt-4o call after the run was resumed from the interrupt
+    "process_insurance_node": Cut("insurance_advisor", "I need insurance for my family", "Looks right", 0.5),
+}
+
+
+def run_input(thread_id: str, messages: List[Dict], state: Dict, resume: Optional[str] = None) -> Dict:
+    return {
+        "threadId": thread_id,
+        "runId": str(uuid.uuid4()),
+        "state": state,
+        "messages": messages,
+        "tools": [],
+        "context": [],
+        "forwardedProps": {"command": {"resume": resume}} if resume else {},
+    }
+
+
+async def stream(client: httpx.AsyncClient, graph_id: str, body: Dict, disconnect_after: Optional[float] = None) -> Dict:
+    """
+    Run to completion and return the last messages and state, or disconnect
+    after `disconnect_after` seconds and return the disconnect time.
+    """
+    result: Dict[str, Any] = {"messages": body["messages"], "state": body["state"]}
+
+    async def read() -> None:
+        async with client.stream("POST", f"/agents/{graph_id}", json=body) as response:
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    event = json.loads(line[5:])
+                    if event["type"] == "MESSAGES_SNAPSHOT":
+                        result["messages"] = event["messages"]
+                    elif event["type"] == "STATE_SNAPSHOT":
+                        result["state"] = event["snapshot"]
+
+    try:
+        await asyncio.wait_for(read(), timeout=disconnect_after)
+    except asyncio.TimeoutError:
+        result["disconnected_at"] = time.perf_counter()
+    return result
+
+
+async def measure(client: httpx.AsyncClient, graph: Any, cut: Cut, latency: float) -> Dict[str, Any]:
+    thread_id = str(uuid.uuid4())
+    messages = [{"id": str(uuid.uuid4()), "role": "user", "content": cut.prompt}]
+    body = run_input(thread_id, messages, {})
+    if cut.resume:
+        result = await stream(client, cut.graph_id, body)
+        body = run_input(thread_id, result["messages"], result["state"], cut.resume)
+
+    cancelled_at.clear()
+    result = await stream(client, cut.graph_id, body, disconnect_after=cut.after * latency)
+    # Wait for the cancellation to reach the model, then for the checkpoint fix-up
+    deadline = time.perf_counter() + latency
+    while not cancelled_at and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.2)
+
+    state = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+    interrupted = any(task.interrupts for task in state.tasks)
+    return {
+        "cancel_delay_ms": round((cancelled_at[0] - result["disconnected_at"]) * 1000, 1) if cancelled_at else None,
+        "pending_nodes": list(state.next),
+        "consistent": not state.next or interrupted,
+    }
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    import server
+    from graphs import load_graph_factories
+    from models import set_default_chat_model
+
+    app = server.create_worker_app(stub_model=True)
+    probe = CancellationProbe(latency=lambda: args.latency)
+    set_default_chat_model(lambda model: probe)
+    # The graph factories are cached, so these are the graphs the app serves
+    graphs = {graph_id: factory() for graph_id, factory in load_graph_factories().items()}
+
+    uvicorn_server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serving = asyncio.create_task(uvicorn_server.serve())
+    results: Dict[str, Any] = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None) as client:
+            while True:
+                try:
+                    if (await client.get("/ready")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+            for name, cut in SCENARIOS.items():
+                results[name] = await measure(client, graphs[cut.graph_id], cut, args.latency)
+            results["metrics"] = (await client.get("/metrics")).json()
+    finally:
+        uvicorn_server.should_exit = True
+        await serving
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per stub model call")
+    parser.add_argument("--max-delay", type=float, default=0.5, help="seconds allowed between disconnect and cancellation")
+    parser.add_argument("--port", type=int, default=8450)
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    failed = [
+        name for name in SCENARIOS
+        if results[name]["cancel_delay_ms"] is None
+        or results[name]["cancel_delay_ms"] > args.max_delay * 1000
+        or not results[name]["consistent"]
+    ]
+
+    if args.json:
+        print(json.dumps({**results, "failed": failed}, indent=2))
+    else:
+        for name in SCENARIOS:
+            result = results[name]
+            print(
+                f"{name}: upstream cancelled {result['cancel_delay_ms']} ms after disconnect, "
+                f"pending nodes {result['pending_nodes']}, consistent {result['consistent']}"
+            )
+        print(f"cancelled work: {results['metrics']['cancelled']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
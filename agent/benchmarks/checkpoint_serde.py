@@ -0,0 +1,158 @@
+"""
+Checkpoint size and encode/decode time: default serializer versus CompactSerializer.
+
+Builds the channel values of a weather/HITL session with 10, 100 and 1000
+messages and serializes every channel the way a checkpointer does.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.checkpoint_serde [--messages 10 100 1000] [--json]
+    python -m benchmarks.checkpoint_serde --train-dictionary   # rewrites checkpoint.zdict
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, Iterator, List
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from checkpoint_serde import DICTIONARY_PATH, CompactSerializer, train_dictionary
+
+CITIES = ["Paris", "Tokyo", "Lima", "Oslo", "Cairo", "Denver", "Perth", "Quito", "Seoul", "Accra"]
+CONDITIONS = ["Sunny", "Cloudy", "Rainy", "Windy", "Foggy", "Snowy"]
+
+
+def weather_data(rng: random.Random, city: str) -> Dict[str, Any]:
+    return {
+        "location": city,
+        "temperature": f"{rng.randint(20, 95)}°F/{rng.randint(-5, 35)}°C",
+        "condition": rng.choice(CONDITIONS),
+        "humidity": f"{rng.randint(10, 95)}%",
+        "wind_speed": f"{rng.randint(0, 30)} mph",
+        "wind_direction": rng.choice(["North", "South", "East", "West"]),
+        "feels_like": f"{rng.randint(20, 95)}°F",
+        "visibility": f"{rng.randint(1, 10)} miles",
+        "uv_index": str(rng.randint(0, 11)),
+        "precipitation_chance": f"{rng.randint(0, 100)}%",
+        "recommendations": [f"Recommendation {rng.randint(0, 999)} for {city}" for _ in range(3)],
+        "clothing_suggestion": f"Layers suited to {city}",
+        "activity_suggestion": f"Explore the old town of {city}",
+    }
+
+
+def weather_report(data: Dict[str, Any]) -> str:
+    """
+    The Markdown report get_weather puts into the ToolMessage.
+    """
+    recommendations = "\n".join(f"• {rec}" for rec in data["recommendations"])
+    return f"""🌤️ **Weather Report for {data['location']}**
+
+**Current Conditions:** {data['condition']}
+**Temperature:** {data['temperature']} (Feels like {data['feels_like']})
+**Humidity:** {data['humidity']}
+**Wind:** {data['wind_speed']} {data['wind_direction']}
+**Visibility:** {data['visibility']}
+**UV Index:** {data['uv_index']}
+**Precipitation Chance:** {data['precipitation_chance']}
+
+**💡 Recommendations:**
+{recommendations}
+
+**👕 Clothing:** {data['clothing_suggestion']}
+**🎯 Activities:** {data['activity_suggestion']}"""
+
+
+def channel_values(messages: int, seed: int) -> Dict[str, Any]:
+    """
+    Channel values of a session with `messages` messages.
+    """
+    rng = random.Random(seed)
+    history: List[Any] = []
+    weather: Dict[str, Any] = {}
+    while len(history) < messages:
+        city = rng.choice(CITIES)
+        call_id = f"call_{rng.getrandbits(64):016x}"
+        data = weather[city] = weather_data(rng, city)
+        history += [
+            HumanMessage(content=f"What's the weather like in {city} today?", id=f"h-{len(history)}"),
+            AIMessage(content="", id=f"a-{len(history)}", tool_calls=[
+                {"name": "get_weather", "args": {"locations": [city]}, "id": call_id, "type": "tool_call"},
+            ]),
+            ToolMessage(content=weather_report(data), tool_call_id=call_id, id=f"t-{len(history)}"),
+            AIMessage(content=f"It is {data['condition'].lower()} in {city} at {data['temperature']}.", id=f"a2-{len(history)}"),
+        ]
+    return {
+        "messages": history[:messages],
+        "weather_data": weather,
+        "steps": [{"description": f"Step {i} of the plan", "status": rng.choice(["enabled", "disabled"])} for i in range(10)],
+    }
+
+
+def sample_values(sessions: int = 200) -> Iterator[Any]:
+    """
+    Channel values used to train the shared dictionary.
+    """
+    for seed in range(sessions):
+        values = channel_values(messages=4 + seed % 40, seed=10_000 + seed)
+        yield from values.values()
+
+
+def measure(serde: Any, values: Dict[str, Any], repeat: int) -> Dict[str, float]:
+    encoded = {key: serde.dumps_typed(value) for key, value in values.items()}
+
+    def timed(fn: Callable[[], Any]) -> float:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    for key, value in values.items():
+        assert serde.loads_typed(encoded[key]) == value, key
+
+    return {
+        "bytes": sum(len(data) for _, data in encoded.values()),
+        "encode_ms": round(timed(lambda: [serde.dumps_typed(v) for v in values.values()]), 3),
+        "decode_ms": round(timed(lambda: [serde.loads_typed(e) for e in encoded.values()]), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20, help="timing repetitions")
+    parser.add_argument("--train-dictionary", action="store_true", help=f"train and write {DICTIONARY_PATH}")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    if args.train_dictionary:
+        dictionary = train_dictionary(sample_values())
+        with open(DICTIONARY_PATH, "wb") as dictionary_file:
+            dictionary_file.write(dictionary.as_bytes())
+        print(f"Wrote {len(dictionary.as_bytes())} byte dictionary {dictionary.dict_id()} to {DICTIONARY_PATH}")
+        return
+
+    serializers = {
+        "default": JsonPlusSerializer(),
+        "compact": CompactSerializer(),
+    }
+    results = {}
+    for messages in args.messages:
+        values = channel_values(messages, seed=messages)
+        results[messages] = {name: measure(serde, values, args.repeat) for name, serde in serializers.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for messages, result in results.items():
+        default, compact = result["default"], result["compact"]
+        print(
+            f"{messages} messages: {default['bytes']} B -> {compact['bytes']} B "
+            f"({compact['bytes'] / default['bytes']:.1%}), "
+            f"encode {default['encode_ms']} -> {compact['encode_ms']} ms, "
+            f"decode {default['decode_ms']} -> {compact['decode_ms']} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Import-time budgets for the graph modules listed in langgraph.json.
+
+Each module is imported in a fresh interpreter with `-X importtime` and the
+report is parsed to get the cumulative import cost. The run fails if a module
+exceeds its budget or eagerly imports one of the lazily loaded dependencies.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.import_time [--runs 5] [--top 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+# Cumulative import budget per graph module, in milliseconds
+IMPORT_BUDGETS_MS = {
+    "agent": 1200,
+    "human_in_the_loop_agent": 1200,
+    "insurance_agent": 1200,
+}
+
+# Dependencies that must only be imported on first use
+LAZY_DEPENDENCIES = [
+    "langchain_openai",
+    "openai",
+    "langgraph.prebuilt",
+]
+
+
+class ImportRecord(NamedTuple):
+    """
+    A single line of the `-X importtime` report.
+    """
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(report: str) -> List[ImportRecord]:
+    """
+    Parse the stderr output of `python -X importtime`.
+    """
+    records = []
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # Skip the header line
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip(" ")
+        records.append(ImportRecord(
+            module=stripped,
+            self_us=int(fields[0]),
+            cumulative_us=int(fields[1]),
+            depth=(len(name) - len(stripped) - 1) // 2,
+        ))
+    return records
+
+
+def measure_module(module: str) -> List[ImportRecord]:
+    """
+    Import a module in a fresh interpreter and return its import records.
+    """
+    agent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=agent_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def run(runs: int, top: int) -> Dict[str, Dict]:
+    """
+    Measure every graph module and check it against its budget.
+    """
+    results = {}
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        samples = []
+        records = []
+        for _ in range(runs):
+            records = measure_module(module)
+            total = next(r for r in records if r.module == module and r.depth == 0)
+            samples.append(total.cumulative_us / 1000)
+
+        imported = {r.module for r in records}
+        eager = [dep for dep in LAZY_DEPENDENCIES if dep in imported]
+        heaviest = sorted(
+            (r for r in records if r.depth == 1),
+            key=lambda r: r.cumulative_us,
+            reverse=True,
+        )[:top]
+
+        median_ms = statistics.median(samples)
+        results[module] = {
+            "median_ms": round(median_ms, 1),
+            "budget_ms": budget_ms,
+            "within_budget": median_ms <= budget_ms and not eager,
+            "eager_lazy_dependencies": eager,
+            "heaviest_imports_ms": {
+                r.module: round(r.cumulative_us / 1000, 1) for r in heaviest
+            },
+        }
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="heaviest direct imports to report")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.runs, args.top)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for module, result in results.items():
+            status = "OK" if result["within_budget"] else "OVER BUDGET"
+            print(f"{module}: {result['median_ms']} ms (budget {result['budget_ms']} ms) {status}")
+            if result["eager_lazy_dependencies"]:
+                print(f"  eagerly imports: {', '.join(result['eager_lazy_dependencies'])}")
+            for name, cost in result["heaviest_imports_ms"].items():
+                print(f"  {cost:>8} ms  {name}")
+
+    return 0 if all(r["within_budget"] for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,460 @@
+"""
+Load generator and soak test for the graphs declared in langgraph.json.
+
+Simulates many concurrent conversations, each on its own thread, against the
+graphs either in-process (with in-memory checkpoints) or through a running
+`server.py`. Every session runs a scenario from the mix for a number of turns:
+
+- weather:   sample_agent calls get_weather and answers;
+- plan:      human_in_the_loop plans steps, is interrupted in process_steps_node
+             and resumed with the user's choice;
+- insurance: insurance_advisor collects details, is interrupted in
+             process_insurance_node and resumed.
+
+Model calls go to `fake_models.ScenarioChatModel` with a configurable latency
+distribution. Every `--interval` seconds a sample is taken of throughput,
+turn latency percentiles, event-loop lag, RSS and checkpoint store size;
+samples and a summary are written as CSV and/or JSON.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.loadgen --sessions 5000 --concurrency 2000 --latency lognormal:0.5,0.4 --json run.json
+    python -m benchmarks.loadgen --duration 3600 --mix weather=2,plan=1,insurance=1 --csv soak.csv
+    python -m benchmarks.loadgen --target http://127.0.0.1:8000 --server-pid 1234 --sessions 2000
+
+Against a server, start it with the same stub model, e.g.
+`python server.py --stub-model --stub-latency lognormal:0.5,0.4`. RSS is then
+read from `--server-pid` and its children, and the checkpoint store size is
+not available.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Scenario(NamedTuple):
+    """
+    A conversation turn: the user prompt and, for graphs that interrupt, the resume value.
+    """
+    graph_id: str
+    prompt: str
+    resume: Optional[str]
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "weather": Scenario("sample_agent", "What's the weather like in Paris?", None),
+    "plan": Scenario("human_in_the_loop", "Make a plan to repaint the kitchen", "Go ahead, I disabled nothing"),
+    "insurance": Scenario("insurance_advisor", "I need insurance for my family", "These details are correct"),
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """
+    Parse "weather=2,plan=1" into scenario weights.
+    """
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of already sorted values.
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def process_rss(pid: int) -> int:
+    """
+    Resident set size in bytes of `pid` and its children (Linux), or of this process elsewhere.
+    """
+    try:
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/statm", encoding="ascii") as statm:
+                total += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children", encoding="ascii") as children:
+                    pending.extend(int(child) for child in children.read().split())
+        return total
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def checkpoint_store_size(saver: Any) -> int:
+    """
+    Serialized bytes held by an in-memory checkpointer.
+    """
+    size = 0
+    for namespaces in list(saver.storage.values()):
+        for checkpoints in list(namespaces.values()):
+            for checkpoint, metadata, _ in list(checkpoints.values()):
+                size += len(checkpoint[1]) + len(metadata[1])
+    for writes in list(saver.writes.values()):
+        size += sum(len(value[1]) for _, _, value, _ in list(writes.values()))
+    size += sum(len(value[1]) for value in list(saver.blobs.values()))
+    return size
+
+
+class InProcessDriver:
+    """
+    Runs the graphs in this process against the scenario model.
+    """
+
+    def __init__(self, latency: str):
+        os.environ["LANGGRAPH_FAST_API"] = "true"
+        # Imported here so the environment is set before the graphs are built
+        from fake_models import ScenarioChatModel, parse_latency
+        from graphs import load_graph_factories
+        from models import set_default_chat_model
+        from langgraph.types import Command
+
+        stub = ScenarioChatModel(latency=parse_latency(latency))
+        set_default_chat_model(lambda model: stub)
+        self.graphs = {graph_id: factory() for graph_id, factory in load_graph_factories().items()}
+        self._command = Command
+
+    async def close(self) -> None:
+        pass
+
+    async def turn(self, session: Dict[str, Any], prompt: str) -> bool:
+        """
+        Send a user message and return whether the run ended in an interrupt.
+        """
+        from langchain_core.messages import HumanMessage
+
+        result = await self.graphs[session["graph_id"]].ainvoke(
+            {"messages": [HumanMessage(content=prompt)], "tools": []}, session["config"]
+        )
+        return "__interrupt__" in result
+
+    async def resume(self, session: Dict[str, Any], value: str) -> bool:
+        result = await self.graphs[session["graph_id"]].ainvoke(self._command(resume=value), session["config"])
+        return "__interrupt__" in result
+
+    def new_session(self, graph_id: str) -> Dict[str, Any]:
+        return {"graph_id": graph_id, "config": {"configurable": {"thread_id": str(uuid.uuid4())}}}
+
+    def rss(self) -> int:
+        return process_rss(os.getpid())
+
+    def checkpoint_bytes(self) -> Optional[int]:
+        return sum(checkpoint_store_size(graph.checkpointer) for graph in self.graphs.values())
+
+
+class ServerDriver:
+    """
+    Runs the scenarios over AG-UI against a server, keeping the client-side
+    messages and state like a frontend does.
+    """
+
+    def __init__(self, target: str, concurrency: int, server_pid: Optional[int]):
+        import httpx
+        import jsonpatch
+
+        self._client = httpx.AsyncClient(
+            base_url=target, timeout=None, limits=httpx.Limits(max_connections=concurrency)
+        )
+        self._apply_patch = jsonpatch.apply_patch
+        self.server_pid = server_pid
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def _run(self, session: Dict[str, Any], forwarded_props: Dict[str, Any]) -> bool:
+        run_input = {
+            "threadId": session["thread_id"],
+            "runId": str(uuid.uuid4()),
+            "state": session["state"],
+            "messages": session["messages"],
+            "tools": [],
+            "context": [],
+            "forwardedProps": forwarded_props,
+        }
+        interrupted = False
+        async with self._client.stream("POST", f"/agents/{session['graph_id']}", json=run_input) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event["type"] == "STATE_SNAPSHOT":
+                    session["state"] = event["snapshot"]
+                elif event["type"] == "STATE_DELTA":
+                    session["state"] = self._apply_patch(session["state"], event["delta"])
+                elif event["type"] == "MESSAGES_SNAPSHOT":
+                    session["messages"] = event["messages"]
+                elif event["type"] == "CUSTOM" and event.get("name") == "on_interrupt":
+                    interrupted = True
+                elif event["type"] == "RUN_ERROR":
+                    raise RuntimeError(event.get("message"))
+        return interrupted
+
+    async def turn(self, session: Dict[str, Any], prompt: str) -> bool:
+        session["messages"] = session["messages"] + [{"id": str(uuid.uuid4()), "role": "user", "content": prompt}]
+        return await self._run(session, {})
+
+    async def resume(self, session: Dict[str, Any], value: str) -> bool:
+        return await self._run(session, {"command": {"resume": value}})
+
+    def new_session(self, graph_id: str) -> Dict[str, Any]:
+        return {"graph_id": graph_id, "thread_id": str(uuid.uuid4()), "state": {}, "messages": []}
+
+    def rss(self) -> Optional[int]:
+        return process_rss(self.server_pid) if self.server_pid else None
+
+    def checkpoint_bytes(self) -> Optional[int]:
+        return None
+
+
+class LoadGenerator:
+    """
+    Starts sessions from the scenario mix and samples the metrics while they run.
+    """
+
+    def __init__(self, driver: Any, args: argparse.Namespace):
+        self.driver = driver
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.rng = random.Random(args.seed)
+        self.started = 0
+        self.active = 0
+        self.completed = 0
+        self.turns = 0
+        self.interrupts = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        self.all_latencies: List[float] = []
+        self.loop_lag = 0.0
+        self.samples: List[Dict[str, Any]] = []
+        self._started_at = self._sampled_at = time.perf_counter()
+        self._sampled_turns = 0
+
+    async def session(self) -> None:
+        scenario = SCENARIOS[self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]]
+        session = self.driver.new_session(scenario.graph_id)
+        self.active += 1
+        try:
+            for turn in range(self.args.turns):
+                if turn and self.args.think_time:
+                    await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+                started = time.perf_counter()
+                interrupted = await self.driver.turn(session, scenario.prompt)
+                if interrupted and scenario.resume is not None:
+                    self.interrupts += 1
+                    await self.driver.resume(session, scenario.resume)
+                self.record(time.perf_counter() - started)
+            self.completed += 1
+        except Exception as e: # pylint: disable=broad-except
+            self.errors += 1
+            if self.errors <= 5:
+                print(f"Session on {scenario.graph_id} failed: {e!r}", file=sys.stderr)
+        finally:
+            self.active -= 1
+
+    def record(self, latency: float) -> None:
+        self.turns += 1
+        self.latencies.append(latency)
+        self.all_latencies.append(latency)
+
+    async def monitor_loop_lag(self, period: float = 0.05) -> None:
+        """
+        Track how late the event loop wakes up a sleeping task.
+        """
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(period)
+            self.loop_lag = max(self.loop_lag, time.perf_counter() - started - period)
+
+    def sample(self) -> None:
+        now = time.perf_counter()
+        latencies = sorted(self.latencies)
+        self.latencies = []
+        rss = self.driver.rss()
+        checkpoint_bytes = self.driver.checkpoint_bytes()
+        row = {
+            "elapsed_s": round(now - self._started_at, 1),
+            "sessions_started": self.started,
+            "sessions_active": self.active,
+            "sessions_completed": self.completed,
+            "turns": self.turns,
+            "interrupts_resumed": self.interrupts,
+            "errors": self.errors,
+            "turns_per_s": round((self.turns - self._sampled_turns) / max(now - self._sampled_at, 1e-9), 1),
+            "latency_p50_ms": _ms(percentile(latencies, 50)),
+            "latency_p90_ms": _ms(percentile(latencies, 90)),
+            "latency_p99_ms": _ms(percentile(latencies, 99)),
+            "latency_max_ms": _ms(latencies[-1] if latencies else None),
+            "loop_lag_max_ms": _ms(self.loop_lag),
+            "rss_mb": round(rss / 2**20, 1) if rss is not None else None,
+            "checkpoint_mb": round(checkpoint_bytes / 2**20, 2) if checkpoint_bytes is not None else None,
+        }
+        self.loop_lag = 0.0
+        self._sampled_at, self._sampled_turns = now, self.turns
+        self.samples.append(row)
+        if not self.args.quiet:
+            print(
+                f"[{row['elapsed_s']:>7}s] active {row['sessions_active']:>5} "
+                f"turns/s {row['turns_per_s']:>7} p50 {row['latency_p50_ms']} ms "
+                f"p99 {row['latency_p99_ms']} ms lag {row['loop_lag_max_ms']} ms "
+                f"rss {row['rss_mb']} MB checkpoints {row['checkpoint_mb']} MB errors {row['errors']}",
+                file=sys.stderr,
+            )
+
+    async def sampler(self) -> None:
+        while True:
+            await asyncio.sleep(self.args.interval)
+            self.sample()
+
+    async def run(self) -> None:
+        self._started_at = self._sampled_at = time.perf_counter()
+        deadline = self._started_at + self.args.duration if self.args.duration else None
+        background = [
+            asyncio.create_task(self.monitor_loop_lag()),
+            asyncio.create_task(self.sampler()),
+        ]
+        self.sample()
+        running = set()
+        while True:
+            if deadline is None and self.started >= self.args.sessions:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if len(running) >= self.args.concurrency:
+                _, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            self.started += 1
+            running.add(asyncio.create_task(self.session()))
+            if self.args.ramp_up:
+                await asyncio.sleep(self.args.ramp_up / self.args.concurrency)
+            elif self.started % 100 == 0:
+                # Let the started sessions make progress while ramping up
+                await asyncio.sleep(0)
+        if running:
+            await asyncio.wait(running)
+        self.sample()
+        for task in background:
+            task.cancel()
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = sorted(self.all_latencies)
+        first, last = self.samples[0], self.samples[-1]
+        elapsed = last["elapsed_s"] or 1
+        return {
+            "sessions": self.started,
+            "sessions_completed": self.completed,
+            "turns": self.turns,
+            "interrupts_resumed": self.interrupts,
+            "errors": self.errors,
+            "elapsed_s": elapsed,
+            "turns_per_s": round(self.turns / elapsed, 1),
+            "latency_p50_ms": _ms(percentile(latencies, 50)),
+            "latency_p90_ms": _ms(percentile(latencies, 90)),
+            "latency_p99_ms": _ms(percentile(latencies, 99)),
+            "latency_max_ms": _ms(latencies[-1] if latencies else None),
+            "loop_lag_max_ms": max((row["loop_lag_max_ms"] or 0) for row in self.samples),
+            "rss_growth_mb": _growth(first["rss_mb"], last["rss_mb"]),
+            "checkpoint_mb": last["checkpoint_mb"],
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _growth(first: Optional[float], last: Optional[float]) -> Optional[float]:
+    return round(last - first, 1) if first is not None and last is not None else None
+
+
+def run_metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    What is needed to compare runs across releases.
+    """
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=AGENT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "mode": "server" if args.target else "in-process",
+        "options": {key: value for key, value in vars(args).items() if key not in ("csv", "json", "quiet")},
+    }
+
+
+async def amain(args: argparse.Namespace) -> LoadGenerator:
+    if args.target:
+        driver = ServerDriver(args.target, args.concurrency, args.server_pid)
+    else:
+        driver = InProcessDriver(args.latency)
+    generator = LoadGenerator(driver, args)
+    try:
+        await generator.run()
+    finally:
+        await driver.close()
+    return generator
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=1000, help="sessions to run (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="soak: keep starting sessions for this many seconds")
+    parser.add_argument("--concurrency", type=int, default=1000, help="sessions in flight")
+    parser.add_argument("--ramp-up", type=float, default=0, help="seconds over which to start the first sessions")
+    parser.add_argument("--turns", type=int, default=2, help="turns per session, each on the same thread")
+    parser.add_argument("--think-time", type=float, default=0, help="mean seconds between the turns of a session")
+    parser.add_argument("--mix", default="weather=1,plan=1,insurance=1", help=f"scenario weights, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", default="lognormal:0.5,0.4",
+                        help="stub model latency in-process (see fake_models.parse_latency)")
+    parser.add_argument("--target", default=None, help="server.py URL, instead of running the graphs in-process")
+    parser.add_argument("--server-pid", type=int, default=None, help="pid of the server, to sample its RSS")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between samples")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", default=None, help="write the samples to this CSV file")
+    parser.add_argument("--json", default=None, help="write metadata, summary and samples to this JSON file")
+    parser.add_argument("--quiet", action="store_true", help="do not print samples while running")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    generator = asyncio.run(amain(args))
+    summary = generator.summary()
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=list(generator.samples[0]))
+            writer.writeheader()
+            writer.writerows(generator.samples)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump({"meta": run_metadata(args), "summary": summary, "samples": generator.samples}, json_file, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Soak test of the checkpoint memory budget: resident checkpoint bytes with and without a budget.
+
+Runs `--sessions` weather conversations of `--turns` turns on sample_agent,
+interleaved `--concurrency` at a time, plus one runaway session of
+`--runaway-turns` turns, against a stub model. The same workload runs once
+with no budget and once with `--budget-mb`, sampling after every turn the
+resident checkpoint bytes and the growth of the process RSS. Every session checks that
+its history survives offloading.
+
+The resident bytes are the saver's own estimate (see thread_memory.py). To
+check it, the memory allocated by Python is traced (tracemalloc) and the
+memory the process still holds once the sessions are over and collected is
+compared with the resident bytes left: beyond `--max-divergence` (a fraction
+of the larger of the two, after 1 MiB of slack) the estimate is off. RSS is
+reported too, but includes memory Python freed and the allocator kept.
+Exits with status 1 if the resident bytes ever exceed the budget, the
+estimate diverges from the traced memory, or a session lost its history.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.memory_budget [--budget-mb 4] [--sessions 400] [--eviction offload] [--json]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict
+from langchain_core.messages import HumanMessage
+from benchmarks.loadgen import process_rss
+from fake_models import ScenarioChatModel
+
+
+async def soak(graph: Any, memory: Any, args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    slots = asyncio.Semaphore(args.concurrency)
+    peak = {"resident_bytes": 0, "rss_bytes": 0, "traced_bytes": 0}
+    lost = []
+
+    async def session(turns: int) -> None:
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        history = 0
+        for _ in range(turns):
+            async with slots:
+                result = await graph.ainvoke(
+                    {"messages": [HumanMessage(content="What's the weather in Paris?")], "tools": []}, config
+                )
+            if len(result["messages"]) <= history:
+                lost.append(config["configurable"]["thread_id"])
+            history = len(result["messages"])
+            peak["resident_bytes"] = max(peak["resident_bytes"], memory.resident_bytes)
+            peak["rss_bytes"] = max(peak["rss_bytes"], process_rss(os.getpid()))
+            peak["traced_bytes"] = max(peak["traced_bytes"], tracemalloc.get_traced_memory()[0])
+            # Let other sessions run between turns, so threads go cold and come back
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+    gc.collect()
+    rss_before = process_rss(os.getpid())
+    traced_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    await asyncio.gather(session(args.runaway_turns), *(session(args.turns) for _ in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    # What is still allocated once every run is over: the checkpoints, plus the saver's bookkeeping
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - traced_before
+    report = memory.report(k=3)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "peak_resident_bytes": peak["resident_bytes"],
+        "final_resident_bytes": report["resident_bytes"],
+        "peak_traced_growth_bytes": peak["traced_bytes"] - traced_before,
+        "retained_bytes": retained,
+        "peak_rss_bytes": peak["rss_bytes"],
+        "rss_growth_bytes": peak["rss_bytes"] - rss_before,
+        "lost_sessions": len(lost),
+        "offloaded": report["offloaded"],
+        "restored": report["restored"],
+        "dropped": report["dropped"],
+        "top_threads": report["top_threads"],
+    }
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    import agent
+    from checkpoint_serde import CompactSerializer
+    from models import set_default_chat_model
+    from thread_memory import ThreadMemory, ThreadMemorySaver
+
+    set_default_chat_model(lambda model: ScenarioChatModel())
+    graph = agent.build_graph()
+    # One untraced turn first, so imports and caches are not counted as checkpoint memory
+    await graph.ainvoke({"messages": [HumanMessage(content="What's the weather in Paris?")], "tools": []},
+                        {"configurable": {"thread_id": "warm-up"}})
+    tracemalloc.start()
+    results = {}
+    # The budget runs first: memory freed by Python is seldom returned to the OS, so RSS only grows
+    for mode, budget_bytes in (("budget", int(args.budget_mb * 1024 * 1024)), ("unbounded", 0)):
+        memory = ThreadMemory(budget_bytes, args.eviction, tempfile.mkdtemp(prefix="offload-"))
+        saver = ThreadMemorySaver(serde=CompactSerializer(), name="sample_agent", memory=memory)
+        results[mode] = await soak(graph.copy({"checkpointer": saver}), memory, args)
+    tracemalloc.stop()
+    results["budget_bytes"] = int(args.budget_mb * 1024 * 1024)
+    return results
+
+
+def divergence(result: Dict[str, Any]) -> float:
+    """
+    How far the resident estimate is from the memory still traced after the soak, as a fraction.
+    """
+    estimate, measured = result["final_resident_bytes"], result["retained_bytes"]
+    return max(0, abs(measured - estimate) - 2**20) / max(estimate, measured, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-mb", type=float, default=4)
+    parser.add_argument("--eviction", choices=["offload", "drop"], default="offload")
+    parser.add_argument("--sessions", type=int, default=400)
+    parser.add_argument("--turns", type=int, default=6, help="turns per session")
+    parser.add_argument("--runaway-turns", type=int, default=100, help="turns of the runaway session")
+    parser.add_argument("--concurrency", type=int, default=50, help="turns running at once")
+    parser.add_argument("--think-time", type=float, default=0.05, help="maximum seconds between the turns of a session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-divergence", type=float, default=0.5,
+                        help="allowed gap between the resident estimate and the traced memory, as a fraction")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    budget = results["budget"]
+    diverged = [mode for mode in ("budget", "unbounded") if divergence(results[mode]) > args.max_divergence]
+    failed = budget["peak_resident_bytes"] > results["budget_bytes"] or bool(diverged) or (
+        args.eviction == "offload" and budget["lost_sessions"] > 0
+    )
+
+    if args.json:
+        print(json.dumps({**results, "diverged": diverged, "failed": failed}, indent=2))
+    else:
+        for mode in ("budget", "unbounded"):
+            result = results[mode]
+            print(
+                f"{mode}: peak {result['peak_resident_bytes'] / 2**20:.1f} MiB resident checkpoints "
+                f"(traced +{result['peak_traced_growth_bytes'] / 2**20:.1f} MiB), "
+                f"left {result['final_resident_bytes'] / 2**20:.1f} MiB estimated / "
+                f"{result['retained_bytes'] / 2**20:.1f} MiB traced, "
+                f"RSS +{result['rss_growth_bytes'] / 2**20:.0f} MiB, {result['elapsed_s']} s, "
+                f"{result['offloaded']} offloaded / {result['restored']} restored / {result['dropped']} dropped, "
+                f"{result['lost_sessions']} sessions lost their history"
+            )
+        print(f"budget {results['budget_bytes'] / 2**20:.1f} MiB, heaviest threads: {budget['top_threads']}")
+        for mode in diverged:
+            print(f"DIVERGED {mode}: the resident estimate is {divergence(results[mode]):.0%} off the traced memory")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Latency of the final-answer step with and without output budgets, against a model that runs long.
+
+Runs `--sessions` plan and insurance conversations (interrupted, then resumed
+into process_steps_node / process_insurance_node), `--concurrency` at a time,
+against `fake_models.RamblingChatModel`: replies of `--sections` `###`
+sections of `--sentences` sentences, streamed one token every
+`--token-latency` seconds. The same sessions run once with output budgets off
+and once with them on, measuring the resume, i.e. the final answer. Reports
+its latency percentiles, and for the budgets their truncation rate, estimated
+latency saved and the max_tokens they adapted to.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.output_budget [--sessions 200] [--sections lognormal:4,0.4] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List
+from langchain_core.messages import HumanMessage
+from langgraph.types import Command
+from benchmarks.loadgen import SCENARIOS, percentile
+from fake_models import RamblingChatModel, parse_latency
+
+
+async def final_answers(graph: Any, prompt: str, resume: str, args: argparse.Namespace) -> List[float]:
+    """
+    Run the sessions and return the seconds taken by each resume.
+    """
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def session() -> None:
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        async with slots:
+            await graph.ainvoke({"messages": [HumanMessage(content=prompt)], "tools": []}, config)
+            started = time.perf_counter()
+            await graph.ainvoke(Command(resume=resume), config)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(session() for _ in range(args.sessions)))
+    return sorted(latencies)
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    import output_budget
+    from bounded_model import wait_for_holdouts
+    from graphs import load_graph_factories
+    from models import set_default_chat_model
+
+    model = RamblingChatModel(
+        sections=parse_latency(args.sections), sentences=parse_latency(args.sentences), token_latency=args.token_latency
+    )
+    set_default_chat_model(lambda name: model)
+    factories = load_graph_factories()
+    results: Dict[str, Any] = {}
+    for name, node in (("plan", "process_steps_node"), ("insurance", "process_insurance_node")):
+        scenario = SCENARIOS[name]
+        graph = factories[scenario.graph_id]()
+        results[name] = {}
+        for mode, enabled in (("unbounded", False), ("bounded", True)):
+            output_budget.ENABLED = enabled
+            latencies = await final_answers(graph, scenario.prompt, scenario.resume, args)
+            results[name][mode] = {
+                f"p{q}_s": round(percentile(latencies, q), 3) for q in (50, 95, 99)
+            }
+            results[name][mode]["max_s"] = round(latencies[-1], 3)
+        # Holdouts finish measuring their overrun in the background
+        await wait_for_holdouts()
+        results[name]["budget"] = output_budget.budgets[node].report()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=200, help="sessions per scenario and mode")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--sections", default="lognormal:4,0.4", help="distribution of the sections per reply")
+    parser.add_argument("--sentences", default="lognormal:3,0.4", help="distribution of the sentences per section")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds per streamed token")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        for mode in ("unbounded", "bounded"):
+            latency = result[mode]
+            print(
+                f"{name:<10} {mode:<10} final answer p50 {latency['p50_s']:.2f} s, "
+                f"p95 {latency['p95_s']:.2f} s, p99 {latency['p99_s']:.2f} s, max {latency['max_s']:.2f} s"
+            )
+        budget = result["budget"]
+        print(
+            f"{name:<10} budget     {budget['truncation_rate']:.0%} truncated "
+            f"({budget['early_stops']} early stops, {budget['length_stops']} at max_tokens), "
+            f"~{budget['latency_saved_s']:.1f} s saved, max_tokens now {budget['max_tokens']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
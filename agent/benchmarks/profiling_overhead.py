@@ -0,0 +1,94 @@
+"""
+Cost of run profiling: graphs without the profiler, with it but off, and profiling every run.
+
+Runs `--runs` weather turns of sample_agent against a stub model that answers
+at once, so the time measured is the graph's own. Profiles are written to a
+temporary directory, and the summary of one profiled run is shown.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.profiling_overhead [--runs 200] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+from langchain_core.messages import HumanMessage
+from fake_models import ScenarioChatModel
+
+
+async def measure(graph: Any, runs: int, metadata: Dict[str, Any]) -> Dict[str, float]:
+    timings: List[float] = []
+    for _ in range(runs):
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}, "metadata": metadata}
+        started = time.perf_counter()
+        await graph.ainvoke({"messages": [HumanMessage(content="What's the weather in Paris?")], "tools": []}, config)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+    }
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    import agent
+    from models import set_default_chat_model
+    import profiling
+
+    set_default_chat_model(lambda model: ScenarioChatModel())
+    directory = profiling.profiler.directory = tempfile.mkdtemp(prefix="profiles-")
+    plain = agent.build_graph()
+    instrumented = profiling.instrument(plain)
+
+    # Warm up imports and caches so the first mode is not penalized
+    await measure(instrumented, 5, {})
+    results: Dict[str, Any] = {
+        "without_profiler": await measure(plain, args.runs, {}),
+        "profiler_off": await measure(instrumented, args.runs, {}),
+        "profiling": await measure(instrumented, max(1, args.runs // 10), {"profile": True}),
+    }
+
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    with open(next(path for path in paths if path.endswith(".json")), encoding="utf-8") as summary_file:
+        summary = json.load(summary_file)
+    results["profiles"] = {
+        "directory": directory,
+        "files": len(paths),
+        "sample_run": {
+            "samples": summary["samples"],
+            "nodes": [(node["node"], node["wall_s"], len(node["allocations"])) for node in summary["nodes"]],
+        },
+    }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    baseline = results["without_profiler"]["mean_ms"]
+    for mode in ("without_profiler", "profiler_off", "profiling"):
+        result = results[mode]
+        print(
+            f"{mode}: {result['mean_ms']} ms mean, {result['median_ms']} ms median "
+            f"({result['mean_ms'] / baseline - 1:+.1%})"
+        )
+    profiles = results["profiles"]
+    print(f"{profiles['files']} profile files in {profiles['directory']}, one run: {profiles['sample_run']}")
+
+
+if __name__ == "__main__":
+    main()
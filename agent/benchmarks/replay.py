@@ -0,0 +1,280 @@
+"""
+Replay regression benchmark: the graphs' own cost per turn, with model calls replayed from a cassette.
+
+Runs the weather, plan and insurance scenarios of loadgen for `--turns` turns
+each (resuming the interrupted ones), with every model call replayed from
+`--cassette` at `--time-scale` (0 by default: no model latency at all), so
+what is left is the local work of a turn. A first pass measures the time per
+turn; a second, instrumented pass splits it into:
+
+- model:          replaying the recorded responses;
+- node code:      the nodes' own code, without their model calls;
+- reducers:       the channel reducers, e.g. the messages reducer;
+- serialization:  checkpoint serialization and deserialization;
+- scheduling:     the rest, i.e. LangGraph's scheduling, checkpointing and callbacks.
+
+The cassette is recorded first when it does not exist or with `--record`:
+against the scenario stub model, or against OpenAI with `--live`. Replays
+must not run more turns than were recorded, and a cassette recorded before
+the graphs' requests changed must be recorded again (the run stops with a
+message saying so). With `--baseline`, a previous
+`--json` output, exits with status 1 if a scenario got more than
+`--max-regression` slower.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.replay [--turns 3] [--repeat 20] [--time-scale 0] [--json]
+    python -m benchmarks.replay --record --live --cassette benchmarks/cassettes/openai.jsonl.zst
+    python -m benchmarks.replay --baseline before.json --max-regression 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langgraph.channels.binop import BinaryOperatorAggregate
+from langgraph.types import Command
+from benchmarks.loadgen import SCENARIOS
+
+DEFAULT_CASSETTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "scenarios.jsonl.zst")
+
+PARTS = ("model", "node code", "reducers", "serialization", "scheduling")
+
+
+class Timings:
+    """
+    Seconds spent per part of the current turn.
+    """
+
+    def __init__(self):
+        self.parts: Dict[str, float] = defaultdict(float)
+
+    def timed(self, part: str, function: Any) -> Any:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.parts[part] += time.perf_counter() - started
+        return wrapper
+
+
+class TimedSerde:
+    """
+    Checkpoint serializer wrapper adding its time to `timings`.
+    """
+
+    def __init__(self, serde: Any, timings: Timings):
+        self.serde = serde
+        self.dumps = timings.timed("serialization", serde.dumps)
+        self.loads = timings.timed("serialization", serde.loads)
+        self.dumps_typed = timings.timed("serialization", serde.dumps_typed)
+        self.loads_typed = timings.timed("serialization", serde.loads_typed)
+
+
+class NodeTimer(BaseCallbackHandler):
+    """
+    Callback handler adding the time of nodes and of model calls to `timings`.
+    """
+    run_inline = True
+
+    def __init__(self, timings: Timings):
+        self.timings = timings
+        self.started: Dict[Any, Tuple[str, float]] = {}
+
+    def on_chain_start(self, serialized: Any, inputs: Any, *, run_id: Any, metadata: Any = None, **kwargs: Any) -> None:
+        if metadata and kwargs.get("name") == metadata.get("langgraph_node"):
+            self.started[run_id] = ("node", time.perf_counter())
+
+    def on_chat_model_start(self, serialized: Any, messages: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self.started[run_id] = ("model", time.perf_counter())
+
+    def _end(self, run_id: Any) -> None:
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            self.timings.parts[started[0]] += time.perf_counter() - started[1]
+
+    def on_chain_end(self, outputs: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        # Interrupts end the node with an error
+        self._end(run_id)
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._end(run_id)
+
+
+async def run_session(graph: Any, prompt: str, resume: Optional[str], turns: int,
+                      callbacks: List[Any], timings: Optional[Timings]) -> List[Dict[str, float]]:
+    """
+    Run one conversation and return the parts of each turn, in seconds.
+    """
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}, "callbacks": callbacks}
+    results = []
+    for _ in range(turns):
+        if timings is not None:
+            timings.parts.clear()
+        started = time.perf_counter()
+        result = await graph.ainvoke({"messages": [HumanMessage(content=prompt)], "tools": []}, config)
+        if "__interrupt__" in result and resume is not None:
+            await graph.ainvoke(Command(resume=resume), config)
+        turn = {"total": time.perf_counter() - started}
+        if timings is not None:
+            turn.update(timings.parts)
+        results.append(turn)
+    return results
+
+
+def instrument(graph: Any, timings: Timings) -> Any:
+    """
+    Copy of `graph` timing its reducers and checkpoint serializer.
+    """
+    channels = {}
+    for name, channel in graph.channels.items():
+        if isinstance(channel, BinaryOperatorAggregate):
+            channel = channel.copy()
+            channel.operator = timings.timed("reducers", channel.operator)
+        channels[name] = channel
+    checkpointer = graph.checkpointer
+    checkpointer.serde = TimedSerde(checkpointer.serde, timings)
+    return graph.copy({"channels": channels})
+
+
+def summarize(turns: List[Dict[str, float]]) -> Dict[str, float]:
+    """
+    Median time per turn and mean time per part, in milliseconds.
+    """
+    summary = {"turn_ms": round(statistics.median(turn["total"] for turn in turns) * 1000, 3)}
+    if len(turns[0]) == 1:
+        return summary
+    parts = {part: statistics.mean(turn.get(part, 0.0) for turn in turns) for part in ("model", "node", "reducers", "serialization")}
+    total = statistics.mean(turn["total"] for turn in turns)
+    breakdown = {
+        "model": parts["model"],
+        "node code": parts["node"] - parts["model"],
+        "reducers": parts["reducers"],
+        "serialization": parts["serialization"],
+    }
+    breakdown["scheduling"] = total - sum(breakdown.values())
+    summary.update({f"{part}_ms": round(value * 1000, 3) for part, value in breakdown.items()})
+    return summary
+
+
+async def record(args: argparse.Namespace) -> Dict[str, int]:
+    from cassette import Cassette
+    from fake_models import ScenarioChatModel, parse_latency
+    from graphs import load_graph_factories
+    from models import set_cassette, set_default_chat_model
+
+    if not args.live:
+        stub = ScenarioChatModel(latency=parse_latency(args.record_latency))
+        set_default_chat_model(lambda model: stub)
+    os.makedirs(os.path.dirname(os.path.abspath(args.cassette)), exist_ok=True)
+    if os.path.exists(args.cassette):
+        os.remove(args.cassette)
+    cassette = Cassette(args.cassette, "record")
+    set_cassette(cassette)
+    factories = load_graph_factories()
+    try:
+        for scenario in SCENARIOS.values():
+            await run_session(factories[scenario.graph_id](), scenario.prompt, scenario.resume, args.turns, [], None)
+    finally:
+        set_cassette(None)
+        set_default_chat_model(None)
+    return cassette.stats
+
+
+async def replay(args: argparse.Namespace) -> Dict[str, Any]:
+    from cassette import Cassette
+    from graphs import load_graph_factories
+    from models import set_cassette
+
+    cassette = Cassette(args.cassette, "replay", args.time_scale)
+    set_cassette(cassette)
+    factories = load_graph_factories()
+    results: Dict[str, Any] = {}
+    for name, scenario in SCENARIOS.items():
+        graph = factories[scenario.graph_id]()
+        # One untimed session first, so imports and caches are warm
+        await run_session(graph, scenario.prompt, scenario.resume, args.turns, [], None)
+        plain, detailed = [], []
+        for _ in range(args.repeat):
+            plain += await run_session(graph, scenario.prompt, scenario.resume, args.turns, [], None)
+        # Instrumenting swaps the serializer of the shared checkpointer, so it comes last
+        timings = Timings()
+        instrumented = instrument(graph, timings)
+        for _ in range(args.repeat):
+            detailed += await run_session(
+                instrumented, scenario.prompt, scenario.resume, args.turns, [NodeTimer(timings)], timings
+            )
+        summary = summarize(detailed)
+        results[name] = {**summary, "turn_ms": summarize(plain)["turn_ms"], "instrumented_turn_ms": summary["turn_ms"]}
+    set_cassette(None)
+    results["cassette"] = cassette.stats
+    return results
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    recorded = None
+    if args.record or not os.path.exists(args.cassette):
+        recorded = await record(args)
+    results = await replay(args)
+    if recorded is not None:
+        results["recorded"] = recorded
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    parser.add_argument("--record", action="store_true", help="record the cassette again before replaying")
+    parser.add_argument("--live", action="store_true", help="record against OpenAI instead of the stub model")
+    parser.add_argument("--record-latency", default="lognormal:0.3,0.4",
+                        help="stub model latency while recording (see fake_models.parse_latency)")
+    parser.add_argument("--turns", type=int, default=3, help="turns per scenario, each on the same thread")
+    parser.add_argument("--repeat", type=int, default=20, help="sessions per scenario and pass")
+    parser.add_argument("--time-scale", type=float, default=0, help="recorded model latency multiplier")
+    parser.add_argument("--baseline", default=None, help="--json output of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="allowed slowdown per turn, as a fraction")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    from cassette import CassetteMiss
+
+    try:
+        results = asyncio.run(amain(args))
+    except CassetteMiss as error:
+        sys.exit(f"Stale cassette: {error}. Record it again with --record.")
+    regressions = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        for name in SCENARIOS:
+            if name in baseline and results[name]["turn_ms"] > baseline[name]["turn_ms"] * (1 + args.max_regression):
+                regressions[name] = {"baseline_ms": baseline[name]["turn_ms"], "turn_ms": results[name]["turn_ms"]}
+
+    if args.json:
+        print(json.dumps({**results, "regressions": regressions}, indent=2))
+    else:
+        print(f"{'scenario':<10} {'turn ms':>8}   " + "  ".join(f"{part:>13}" for part in PARTS))
+        for name in SCENARIOS:
+            result = results[name]
+            parts = "  ".join(f"{result[f'{part}_ms']:>10.2f} ms" for part in PARTS)
+            print(f"{name:<10} {result['turn_ms']:>8.2f}   {parts}")
+        print(f"cassette: {results['cassette']}")
+        for name, regression in regressions.items():
+            print(f"REGRESSION {name}: {regression['baseline_ms']} ms -> {regression['turn_ms']} ms per turn")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
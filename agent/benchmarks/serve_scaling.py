@@ -0,0 +1,122 @@
+"""
+Throughput of server.py as the number of worker processes grows.
+
+For every worker count, starts the server with the stub model, drives it with
+concurrent AG-UI runs on distinct threads and reports runs per second and the
+scaling efficiency relative to a single worker. Expect near-linear scaling up
+to the number of physical cores.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.serve_scaling [--workers 1 2 4] [--concurrency 64] [--runs 2000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, List
+import httpx
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_input(thread_id: str) -> Dict:
+    """
+    A minimal AG-UI run with one user message.
+    """
+    return {
+        "threadId": thread_id,
+        "runId": str(uuid.uuid4()),
+        "state": {},
+        "messages": [{"id": str(uuid.uuid4()), "role": "user", "content": "Hello"}],
+        "tools": [],
+        "context": [],
+        "forwardedProps": {},
+    }
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError("server did not become ready")
+
+
+async def drive(port: int, graph_id: str, concurrency: int, runs: int) -> float:
+    """
+    Run `runs` AG-UI runs with `concurrency` in flight and return runs per second.
+    """
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+        await wait_ready(client)
+        remaining = runs
+
+        async def session() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                async with client.stream("POST", f"/agents/{graph_id}", json=run_input(str(uuid.uuid4()))) as response:
+                    response.raise_for_status()
+                    async for _ in response.aiter_raw():
+                        pass
+
+        started = time.perf_counter()
+        await asyncio.gather(*(session() for _ in range(concurrency)))
+        return runs / (time.perf_counter() - started)
+
+
+def measure(workers: int, port: int, graph_id: str, concurrency: int, runs: int) -> float:
+    """
+    Start the server with `workers` processes and measure its throughput.
+    """
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--workers", str(workers), "--port", str(port), "--stub-model"],
+        cwd=AGENT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        return asyncio.run(drive(port, graph_id, concurrency, runs))
+    finally:
+        server.terminate()
+        server.wait(60)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    default_workers = sorted({1, 2, 4, os.cpu_count() or 1})
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--graph", default="sample_agent", help="graph id to run")
+    parser.add_argument("--concurrency", type=int, default=64, help="runs in flight")
+    parser.add_argument("--runs", type=int, default=2000, help="runs per worker count")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    for workers in args.workers:
+        throughput = measure(workers, args.port, args.graph, args.concurrency, args.runs)
+        baseline = results[0]["runs_per_second"] / results[0]["workers"] if results else throughput / workers
+        results.append({
+            "workers": workers,
+            "runs_per_second": round(throughput, 1),
+            "efficiency": round(throughput / (baseline * workers), 2),
+        })
+        if not args.json:
+            print(f"{workers} workers: {throughput:.1f} runs/s, efficiency {results[-1]['efficiency']}")
+
+    if args.json:
+        print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Bytes streamed per run by the AG-UI endpoint, and STATE_SNAPSHOT versus STATE_DELTA encoding.
+
+Endpoint: runs a `--runs` run weather conversation through the AG-UI endpoint
+of server.py (`agui.add_agent_endpoint`) against the scenario stub model,
+the client sending back the messages and state it received, and counts the
+bytes of the event stream of each run by event type, for:
+
+- ag-ui-langgraph:  the events of `ag_ui_langgraph.LangGraphAgent` as is;
+- deltas + raw:     `DeltaLangGraphAgent` with AGENT_AGUI_RAW_EVENTS=true;
+- deltas:           `DeltaLangGraphAgent`, without RAW events and `rawEvent`
+                    fields (the default).
+
+Encoding: replays a synthetic session for each shared-state shape
+(`weather_data`, `steps`, `insurance_details`) and encodes every state change
+both as a full snapshot and as an RFC 6902 delta against the previous state.
+This is the cost of one state event, not of what a run streams.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.state_delta [--runs 10] [--turns 50] [--json]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List
+import jsonpatch
+from ag_ui.core import EventType, StateDeltaEvent, StateSnapshotEvent
+from ag_ui.encoder import EventEncoder
+from state_delta import compute_state_delta
+
+CITIES = ["Paris", "Tokyo", "Lima", "Oslo", "Cairo"]
+
+
+def message(role: str, content: str, index: int) -> Dict[str, Any]:
+    """
+    A message as it appears in a serialized snapshot.
+    """
+    return {"type": role, "content": content, "id": f"msg-{index}", "additional_kwargs": {}, "response_metadata": {}}
+
+
+def weather_session(turns: int) -> Iterator[Dict[str, Any]]:
+    """
+    Every turn asks for the weather in another city.
+    """
+    state: Dict[str, Any] = {"messages": [], "weather_data": {}}
+    for turn in range(turns):
+        city = CITIES[turn % len(CITIES)]
+        state["messages"] += [
+            message("human", f"What's the weather in {city}?", 4 * turn),
+            message("ai", "", 4 * turn + 1),
+            message("tool", f"🌤️ **Weather Report for {city}** " + "details " * 120, 4 * turn + 2),
+            message("ai", f"It is sunny in {city}.", 4 * turn + 3),
+        ]
+        state["weather_data"][city] = {
+            "location": city, "temperature": f"{60 + turn % 20}°F", "condition": "Sunny",
+            "humidity": "45%", "wind_speed": "5 mph", "wind_direction": "North", "feels_like": "62°F",
+            "visibility": "10 miles", "uv_index": "4", "precipitation_chance": "10%",
+            "recommendations": ["Wear sunscreen", "Stay hydrated"],
+            "clothing_suggestion": "Light layers", "activity_suggestion": "Walk in the park",
+        }
+        yield copy.deepcopy(state)
+
+
+def steps_session(turns: int) -> Iterator[Dict[str, Any]]:
+    """
+    A 10-step plan where one step is toggled per update.
+    """
+    state: Dict[str, Any] = {
+        "messages": [message("human", "Plan a trip to Mars", 0)],
+        "steps": [{"description": f"Step {i}", "status": "enabled"} for i in range(10)],
+    }
+    for turn in range(turns):
+        step = state["steps"][turn % 10]
+        step["status"] = "disabled" if step["status"] == "enabled" else "enabled"
+        if turn % 5 == 4:
+            state["messages"].append(message("ai", "Performing the task creatively.", turn + 1))
+        yield copy.deepcopy(state)
+
+
+def insurance_session(turns: int) -> Iterator[Dict[str, Any]]:
+    """
+    Insurance details where a single field is edited per update.
+    """
+    state: Dict[str, Any] = {
+        "messages": [message("human", "I need health insurance for my family", 0)],
+        "insurance_details": {"number_of_persons": 4, "budget_range": "", "insurance_type": "health", "location": ""},
+    }
+    for turn in range(turns):
+        state["insurance_details"]["budget_range"] = f"${200 + 10 * turn}-${400 + 10 * turn}"
+        yield copy.deepcopy(state)
+
+
+SESSIONS: Dict[str, Callable[[int], Iterator[Dict[str, Any]]]] = {
+    "weather_data": weather_session,
+    "steps": steps_session,
+    "insurance_details": insurance_session,
+}
+
+
+def measure(states: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Encode every state change as a snapshot and as a delta.
+    """
+    encoder = EventEncoder()
+    snapshot_bytes, delta_bytes, snapshot_us, delta_us = [], [], [], []
+
+    for previous, current in zip(states, states[1:]):
+        started = time.perf_counter()
+        encoded = encoder.encode(StateSnapshotEvent(type=EventType.STATE_SNAPSHOT, snapshot=current))
+        snapshot_us.append((time.perf_counter() - started) * 1e6)
+        snapshot_bytes.append(len(encoded.encode("utf-8")))
+
+        started = time.perf_counter()
+        delta = compute_state_delta(previous, current)
+        encoded = encoder.encode(StateDeltaEvent(type=EventType.STATE_DELTA, delta=delta))
+        delta_us.append((time.perf_counter() - started) * 1e6)
+        delta_bytes.append(len(encoded.encode("utf-8")))
+
+    return {
+        "snapshot_bytes_per_event": round(statistics.mean(snapshot_bytes)),
+        "delta_bytes_per_event": round(statistics.mean(delta_bytes)),
+        "bytes_saved_pct": round(100 * (1 - sum(delta_bytes) / sum(snapshot_bytes)), 1),
+        "snapshot_us_per_event": round(statistics.mean(snapshot_us), 1),
+        "delta_us_per_event": round(statistics.mean(delta_us), 1),
+    }
+
+
+async def endpoint_runs(runs: int) -> Dict[str, Any]:
+    """
+    Bytes of the event stream of each run of a weather conversation, by event type.
+    """
+    import httpx
+    from fastapi import FastAPI
+    import agent
+    import agui
+
+    app = FastAPI()
+    agui.add_agent_endpoint(app, "sample_agent", agent.build_graph(), "/sample_agent")
+    thread_id = str(uuid.uuid4())
+    messages: List[Dict[str, Any]] = []
+    state: Dict[str, Any] = {}
+    per_run, by_type = [], Counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://agent") as client:
+        for run in range(runs):
+            messages.append({"id": str(uuid.uuid4()), "role": "user", "content": f"What's the weather in {CITIES[run % len(CITIES)]}?"})
+            body = {
+                "threadId": thread_id, "runId": str(uuid.uuid4()), "state": state, "messages": messages,
+                "tools": [], "context": [], "forwardedProps": {},
+            }
+            response = await client.post("/sample_agent", json=body, headers={"accept": "text/event-stream"})
+            response.raise_for_status()
+            total = 0
+            for line in response.text.splitlines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                size = len(line.encode("utf-8")) + 2
+                total += size
+                by_type[event["type"]] += size
+                # Keep what the client would hold for the next run
+                if event["type"] == "STATE_SNAPSHOT":
+                    state = event["snapshot"]
+                elif event["type"] == "STATE_DELTA":
+                    state = jsonpatch.apply_patch(state, event["delta"])
+                elif event["type"] == "MESSAGES_SNAPSHOT":
+                    messages = event["messages"]
+            per_run.append(total)
+    return {
+        "first_run_bytes": per_run[0],
+        "later_run_bytes": round(statistics.mean(per_run[1:])) if runs > 1 else None,
+        "total_bytes": sum(per_run),
+        "bytes_by_type": dict(by_type.most_common()),
+    }
+
+
+async def endpoint(runs: int) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    from ag_ui_langgraph import LangGraphAgent
+    import agui
+    from fake_models import ScenarioChatModel
+    from models import set_default_chat_model
+
+    set_default_chat_model(lambda model: ScenarioChatModel())
+    delta_agent = agui.DeltaLangGraphAgent
+    results = {}
+    for mode, agent_class, raw_events in (
+        ("ag-ui-langgraph", LangGraphAgent, True), ("deltas + raw", delta_agent, True), ("deltas", delta_agent, False),
+    ):
+        agui.DeltaLangGraphAgent, agui.RAW_EVENTS = agent_class, raw_events
+        results[mode] = await endpoint_runs(runs)
+    agui.DeltaLangGraphAgent, agui.RAW_EVENTS = delta_agent, False
+    set_default_chat_model(None)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="runs of the conversation sent to the endpoint")
+    parser.add_argument("--turns", type=int, default=50, help="state updates per synthetic session")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    endpoint_results = asyncio.run(endpoint(args.runs))
+    results = {name: measure(list(session(args.turns))) for name, session in SESSIONS.items()}
+    if args.json:
+        print(json.dumps({"endpoint": endpoint_results, "encoding": results}, indent=2))
+        return
+
+    baseline = endpoint_results["ag-ui-langgraph"]["total_bytes"]
+    for mode, result in endpoint_results.items():
+        top = ", ".join(f"{event_type} {size / 1024:.1f}" for event_type, size in list(result["bytes_by_type"].items())[:3])
+        print(
+            f"endpoint {mode:<16} first run {result['first_run_bytes'] / 1024:.1f} KiB, "
+            f"later runs {result['later_run_bytes'] / 1024:.1f} KiB, "
+            f"{1 - result['total_bytes'] / baseline:.0%} saved (top KiB: {top})"
+        )
+    for name, result in results.items():
+        print(
+            f"encoding {name}: {result['snapshot_bytes_per_event']} B/snapshot vs "
+            f"{result['delta_bytes_per_event']} B/delta ({result['bytes_saved_pct']}% saved), "
+            f"{result['snapshot_us_per_event']} us vs {result['delta_us_per_event']} us per event"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Prompt tokens and checkpoint size of a long weather session: Markdown, compact and collapsed tool results.
+
+Runs one `--turns` turn conversation on sample_agent in which every turn asks
+for the weather in one or two cities, against a stub of gpt-4o generating
+reports of realistic size. The session runs four times:
+
+- markdown:  tool messages hold the rendered Markdown reports, as before;
+- compact:   tool messages hold the canonical JSON of the reports, with
+             short keys and without defaulted fields;
+- collapsed: compact, and results older than `--collapse-after` user turns
+             are replaced by a one-line summary;
+- dev:       as served by `langgraph dev`, tool messages hold the Markdown
+             rendered from the compact payload, and are collapsed the same.
+
+Reports the input tokens of all model calls (estimated as 4 characters each,
+including the tool schemas), those of the last turn, and the size of the
+conversation: its messages serialized without compression, the same as the
+checkpointer stores them (compressed), and all the bytes the checkpointer
+holds for the thread, i.e. every checkpoint of the session.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.tool_results [--turns 50] [--collapse-after 3] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import uuid
+from typing import Any, Dict, List
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from benchmarks.weather_batch import CITIES, UsageCounter, WeatherModelStub, estimate_tokens, weather_json
+
+CONDITIONS = ["Sunny", "Partly Cloudy", "Overcast", "Light Rain", "Thunderstorms", "Fog", "Snow Showers", "Windy"]
+TIPS = [
+    "Carry an umbrella in the afternoon", "Use sunscreen at midday", "Stay hydrated", "Expect slippery sidewalks",
+    "Plan indoor activities after 3 PM", "Wear layers you can take off", "Check for flight delays",
+    "Keep a scarf handy for the evening wind", "Morning is the best time to be outside", "Avoid exposed viewpoints",
+]
+
+
+class SessionModelStub(WeatherModelStub):
+    """
+    Stub of gpt-4o calling get_weather for the cities of each question, then answering.
+    """
+
+    rng: Any = None
+
+    def varied_weather(self, city: str) -> Dict[str, Any]:
+        """
+        A report of the size gpt-4o typically generates, different on every call.
+        """
+        fahrenheit = self.rng.randint(20, 95)
+        report = weather_json(city)
+        report.update({
+            "temperature": f"{fahrenheit}°F/{round((fahrenheit - 32) / 1.8)}°C",
+            "feels_like": f"{fahrenheit - 2}°F/{round((fahrenheit - 34) / 1.8)}°C",
+            "condition": self.rng.choice(CONDITIONS),
+            "humidity": f"{self.rng.randint(20, 95)}%",
+            "wind_speed": f"{self.rng.randint(0, 30)} mph",
+            "precipitation_chance": f"{self.rng.randint(0, 100)}%",
+            "recommendations": [f"Carry a light jacket in {city}", *self.rng.sample(TIPS, 2)],
+        })
+        return report
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        if "get_weather" not in self.bound_tools:
+            locations = json.loads(str(messages[-1].content).splitlines()[1])
+            content = json.dumps([self.varied_weather(city) for city in locations], indent=2)
+            return AIMessage(content=content, usage_metadata={
+                "input_tokens": sum(estimate_tokens(str(m.content)) + 4 for m in messages),
+                "output_tokens": estimate_tokens(content),
+                "total_tokens": sum(estimate_tokens(str(m.content)) + 4 for m in messages) + estimate_tokens(content),
+            })
+        last = messages[-1]
+        if isinstance(last, HumanMessage):
+            cities = str(last.content).split(" in ", 1)[1].rstrip("?").split(" and ")
+            message = AIMessage(content="", tool_calls=[{
+                "name": "get_weather", "args": {"locations": cities},
+                "id": f"call_{uuid.uuid4().hex[:24]}", "type": "tool_call",
+            }])
+        else:
+            message = AIMessage(content="It is partly cloudy and 68°F there, a light jacket will do.")
+        input_tokens = self.schema_tokens + sum(estimate_tokens(str(m.content)) + 4 for m in messages)
+        output_tokens = estimate_tokens(str(message.content) + json.dumps(message.tool_calls))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+
+def markdown_payload(reports: List[dict]) -> str:
+    from agent import format_weather_report
+    return "\n\n".join(format_weather_report(report) for report in reports)
+
+
+async def session(graph: Any, turns: int) -> Dict[str, Any]:
+    from models import use_chat_model
+
+    stub = SessionModelStub(base_latency=0, token_latency=0, rng=random.Random(0))
+    thread_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": thread_id}}
+    usage = UsageCounter()
+    last_turn = 0
+    with use_chat_model(lambda model: stub):
+        for turn in range(turns):
+            cities = [CITIES[turn % len(CITIES)]] if turn % 2 else [CITIES[turn % len(CITIES)], CITIES[(turn + 3) % len(CITIES)]]
+            question = f"What's the weather in {' and '.join(cities)}?"
+            before = usage.input_tokens
+            result = await graph.ainvoke(
+                {"messages": [HumanMessage(content=question)], "tools": []}, {**config, "callbacks": [usage]}
+            )
+            last_turn = usage.input_tokens - before
+
+    messages = result["messages"]
+    return {
+        "input_tokens": usage.input_tokens,
+        "last_turn_input_tokens": last_turn,
+        "history_bytes": len(JsonPlusSerializer().dumps_typed(messages)[1]),
+        "checkpoint_bytes": len(graph.checkpointer.serde.dumps_typed(messages)[1]),
+        "tool_result_chars": sum(len(str(m.content)) for m in messages if isinstance(m, ToolMessage)),
+        "stored_bytes": graph.checkpointer.thread_bytes.get(thread_id, 0),
+    }
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    import agent
+    import tool_results
+
+    graph = agent.build_graph()
+    results = {}
+    compact_payload = agent.weather_payload
+    for mode in ("markdown", "compact", "collapsed", "dev"):
+        # The Markdown mode stores the reports as rendered for the chat, like the tool messages used to
+        agent.weather_payload = markdown_payload if mode == "markdown" else compact_payload
+        tool_results.COLLAPSE_AFTER_TURNS = args.collapse_after if mode in ("collapsed", "dev") else 0
+        os.environ["LANGGRAPH_FAST_API"] = "false" if mode == "dev" else "true"
+        results[mode] = await session(graph, args.turns)
+    agent.weather_payload = compact_payload
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--collapse-after", type=int, default=3, help="user turns after which tool results are collapsed")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    baseline = results["markdown"]
+    for mode, result in results.items():
+        print(
+            f"{mode:<10} {result['input_tokens']:>8} input tokens ({result['last_turn_input_tokens']} in the last turn), "
+            f"history {result['history_bytes'] / 1024:.1f} KiB ({result['checkpoint_bytes'] / 1024:.1f} KiB compressed), "
+            f"thread {result['stored_bytes'] / 1024:.0f} KiB"
+        )
+        if mode != "markdown":
+            reductions = ", ".join(
+                f"{label} {1 - result[key] / baseline[key]:.0%}" for label, key in (
+                    ("input tokens", "input_tokens"), ("history", "history_bytes"),
+                    ("compressed", "checkpoint_bytes"), ("thread", "stored_bytes"),
+                )
+            )
+            print(f"{'':<10} reduction vs markdown: {reductions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Latency and token cost of the weather for several cities: batched versus per-call.
+
+Runs sample_agent for one question about `--cities` cities against a stub of
+gpt-4o whose latency grows with the number of tokens it generates:
+
+- per-call: the model calls get_weather for one city at a time, so every
+  city costs a chat_node round trip plus its own weather generation;
+- batched: the model passes every city to a single get_weather call, which
+  generates all reports with one model call.
+
+Tokens are estimated as 4 characters each, including the bound tool schemas.
+
+Usage (from the `agent` directory):
+    python -m benchmarks.weather_batch [--cities 5] [--base-latency 0.4] [--token-latency 0.02] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from fake_models import ScenarioChatModel
+
+CITIES = ["Paris", "Tokyo", "Lima", "Oslo", "Cairo", "Denver", "Perth", "Quito", "Seoul", "Accra"]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def weather_json(city: str) -> Dict[str, Any]:
+    """
+    A report of the size gpt-4o typically generates.
+    """
+    return {
+        "location": city, "temperature": "68°F/20°C", "condition": "Partly Cloudy", "humidity": "55%",
+        "wind_speed": "8 mph", "wind_direction": "West", "feels_like": "67°F/19°C", "visibility": "10 miles",
+        "uv_index": "5", "precipitation_chance": "15%",
+        "recommendations": [f"Carry a light jacket in {city}", "Use sunscreen at midday", "Stay hydrated"],
+        "clothing_suggestion": "Light layers with a jacket for the evening",
+        "activity_suggestion": f"A walking tour of {city} or an afternoon in a park",
+    }
+
+
+class WeatherModelStub(ScenarioChatModel):
+    """
+    Stub of gpt-4o for a multi-city weather question, reporting token usage.
+    """
+    batched: bool = True
+    cities: List[str] = []
+    base_latency: float = 0.4
+    token_latency: float = 0.02
+    schema_tokens: int = 0
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "WeatherModelStub":
+        schemas = [convert_to_openai_tool(tool) for tool in tools]
+        return self.model_copy(update={
+            "bound_tools": tuple(schema["function"]["name"] for schema in schemas),
+            "schema_tokens": estimate_tokens(json.dumps(schemas)),
+        })
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        if "get_weather" not in self.bound_tools:
+            # The generation inside fetch_weather: the prompt lists the locations as JSON
+            locations = json.loads(str(messages[-1].content).splitlines()[1])
+            message = AIMessage(content=json.dumps([weather_json(city) for city in locations], indent=2))
+        else:
+            answered = len([m for m in messages if isinstance(m, ToolMessage)])
+            pending = self.cities[answered:] if not self.batched or not answered else []
+            if pending:
+                locations = pending if self.batched else pending[:1]
+                message = AIMessage(content="", tool_calls=[{
+                    "name": "get_weather", "args": {"locations": locations},
+                    "id": f"call_{uuid.uuid4().hex[:24]}", "type": "tool_call",
+                }])
+            else:
+                message = AIMessage(content=" ".join(
+                    f"In {city} it is partly cloudy and 68°F, a light jacket will do." for city in self.cities
+                ))
+
+        input_tokens = self.schema_tokens + sum(estimate_tokens(str(m.content)) + 4 for m in messages)
+        output_tokens = estimate_tokens(str(message.content) + json.dumps(message.tool_calls))
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        from langchain_core.outputs import ChatGeneration, ChatResult
+
+        message = self._respond(messages)
+        await asyncio.sleep(self.base_latency + self.token_latency * message.usage_metadata["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class UsageCounter(BaseCallbackHandler):
+    """
+    Sums the token usage of every model call of a run.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        usage = response.generations[0][0].message.usage_metadata or {}
+        self.calls += 1
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+
+
+async def measure(graph: Any, stub: WeatherModelStub) -> Dict[str, Any]:
+    from models import use_chat_model
+
+    cities = stub.cities
+    question = f"What's the weather in {', '.join(cities[:-1])} and {cities[-1]}?"
+    usage = UsageCounter()
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}, "callbacks": [usage]}
+    with use_chat_model(lambda model: stub):
+        started = time.perf_counter()
+        result = await graph.ainvoke({"messages": [HumanMessage(content=question)], "tools": []}, config)
+        elapsed = time.perf_counter() - started
+    assert sorted(result["weather_data"]) == sorted(cities), result["weather_data"].keys()
+    return {
+        "latency_s": round(elapsed, 2),
+        "model_calls": usage.calls,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+    }
+
+
+async def amain(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+    import agent
+
+    graph = agent.get_graph()
+    cities = CITIES[:args.cities]
+    results = {}
+    for mode, batched in (("per_call", False), ("batched", True)):
+        stub = WeatherModelStub(
+            batched=batched, cities=cities, base_latency=args.base_latency, token_latency=args.token_latency
+        )
+        results[mode] = await measure(graph, stub)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cities", type=int, default=5, choices=range(1, len(CITIES) + 1))
+    parser.add_argument("--base-latency", type=float, default=0.4, help="seconds per model call")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="seconds per generated token")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(amain(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for mode, result in results.items():
+        print(
+            f"{mode}: {result['latency_s']} s, {result['model_calls']} model calls, "
+            f"{result['input_tokens']} input + {result['output_tokens']} output tokens"
+        )
+    per_call, batched = results["per_call"], results["batched"]
+    print(
+        f"batched saves {1 - batched['latency_s'] / per_call['latency_s']:.0%} latency and "
+        f"{1 - (batched['input_tokens'] + batched['output_tokens']) / (per_call['input_tokens'] + per_call['output_tokens']):.0%} tokens"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Chat model applying an `output_budget.OutputBudget` to another chat model.
+
+The response of the wrapped model is streamed and cut at the budget's
+boundary, and the request is closed there, so the model stops generating.
+Only the kept part is streamed to the callbacks, so clients never see the
+text past the cut. Holdout calls (async only) return the cut response just
+the same, and leave a background task reading the rest of the stream to
+measure how long it would have gone on.
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set
+from langchain_core.callbacks import AsyncCallbackManager, CallbackManager
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from cassette import as_chunk
+from output_budget import estimate_tokens
+
+# Background tasks reading the rest of holdout responses, referenced until they finish
+_holdout_tasks: Set["asyncio.Task[None]"] = set()
+
+
+async def wait_for_holdouts() -> None:
+    """
+    Wait until the holdout responses being read in the background are recorded.
+    """
+    await asyncio.gather(*_holdout_tasks, return_exceptions=True)
+
+
+class BoundedChatModel(BaseChatModel):
+    """
+    Chat model streaming the response of `inner` within an `OutputBudget`.
+    """
+    inner: BaseChatModel
+    budget: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "bounded"
+
+    def _start(self, stop: Optional[List[str]], kwargs: Dict[str, Any], holdouts: bool) -> Dict[str, Any]:
+        holdout = holdouts and random.random() < self.budget.holdout_rate
+        # Holdouts run up to the cap, so the adapted max_tokens does not hide how long responses get
+        limit = self.budget.max_cap if holdout else self.budget.max_tokens
+        return {
+            "limit": limit,
+            "model": self.inner.bind(max_tokens=limit, stop=stop, **kwargs),
+            "holdout": holdout,
+            "text": "",
+            "chars": 0,
+            "chunks": 0,
+            "cut_tokens": None,
+        }
+
+    def _cut(self, message: BaseMessage, state: Dict[str, Any]) -> Optional[AIMessageChunk]:
+        """
+        Return the part of `message` within the budget, or None once the boundary was passed.
+        """
+        chunk = as_chunk(message)
+        if not state["chunks"]:
+            state["first_token"] = time.perf_counter()
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        state["chars"] += len(content)
+        state["chunks"] += 1 if content else 0
+        state["finish_reason"] = chunk.response_metadata.get("finish_reason") or state.get("finish_reason")
+        if state["cut_tokens"] is not None:
+            return None
+        offset = len(state["text"])
+        state["text"] += content
+        keep = self.budget.boundary(state["text"])
+        if keep is None:
+            return chunk
+        state["text"] = state["text"][:keep]
+        state["cut_tokens"] = estimate_tokens(keep, state["chunks"])
+        return AIMessageChunk(content=content[:max(0, keep - offset)], response_metadata={"finish_reason": "early_stop"})
+
+    def _finish(self, state: Dict[str, Any]) -> None:
+        seconds = time.perf_counter() - state.get("first_token", time.perf_counter())
+        tokens = estimate_tokens(state["chars"], state["chunks"])
+        hit_limit = state.get("finish_reason") == "length" or tokens >= state["limit"]
+        if state["cut_tokens"] is None:
+            self.budget.observe(tokens, seconds, False, hit_limit)
+        elif state["holdout"]:
+            self.budget.observe(state["cut_tokens"], seconds, False, hit_limit, tokens - state["cut_tokens"])
+        else:
+            self.budget.observe(state["cut_tokens"], seconds, True, False)
+
+    # The inner model is called without callbacks, so its run does not show up next to this one
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        state = self._start(stop, kwargs, holdouts=True)
+        stream = state["model"].astream(messages, {"callbacks": AsyncCallbackManager([])})
+        detached = False
+        try:
+            async for message in stream:
+                message = self._cut(message, state)
+                if message is not None:
+                    chunk = ChatGenerationChunk(message=message)
+                    if run_manager is not None:
+                        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                if state["cut_tokens"] is not None:
+                    if state["holdout"]:
+                        # The response is complete for the caller, the rest is only measured
+                        task = asyncio.ensure_future(self._drain(stream, state))
+                        _holdout_tasks.add(task)
+                        task.add_done_callback(_holdout_tasks.discard)
+                        detached = True
+                    break
+        finally:
+            # Closing the stream closes the request, so the model stops generating
+            if not detached:
+                await stream.aclose()
+        if not detached:
+            self._finish(state)
+
+    async def _drain(self, stream: AsyncIterator[BaseMessage], state: Dict[str, Any]) -> None:
+        """
+        Read the rest of a holdout response past its cut, then record it.
+        """
+        try:
+            async for message in stream:
+                self._cut(message, state)
+        finally:
+            await stream.aclose()
+        self._finish(state)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # Nothing reads a sync stream past the cut, so there are no holdouts
+        state = self._start(stop, kwargs, holdouts=False)
+        stream = state["model"].stream(messages, {"callbacks": CallbackManager([])})
+        try:
+            for message in stream:
+                message = self._cut(message, state)
+                if message is not None:
+                    chunk = ChatGenerationChunk(message=message)
+                    if run_manager is not None:
+                        run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+                if state["cut_tokens"] is not None:
+                    break
+        finally:
+            stream.close()
+        self._finish(state)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
@@ -0,0 +1,133 @@
+"""
+Cancellation of runs whose client went away.
+
+When the client disconnects or aborts a run, the AG-UI endpoint cancels the
+graph task. The cancellation reaches the node coroutines and, through them,
+the in-flight model requests and tool coroutines. `InFlightCalls` records
+which calls were cut short, and `finish_cancelled_run` leaves the thread in a
+state the next run can continue from.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.constants import END
+from langgraph.pregel import Pregel
+
+logger = logging.getLogger(__name__)
+
+# Content of the tool messages answering tool calls cut short by a cancellation
+CANCELLED_TOOL_RESULT = "Cancelled: the user stopped this run before the tool finished."
+
+# Work cancelled since startup, reported by the /metrics endpoints
+cancelled_work: Dict[str, float] = {
+    "runs": 0,
+    "model_calls": 0,
+    "tool_calls": 0,
+    # Time the cancelled calls had already been running
+    "call_seconds": 0.0,
+}
+
+# Checkpoint fix-ups in progress, referenced so they are not garbage collected
+_cleanups: "set[asyncio.Future[Any]]" = set()
+
+
+class InFlightCalls(BaseCallbackHandler):
+    """
+    Callback handler tracking the model and tool calls of one run that have not finished.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self.calls: Dict[UUID, Tuple[str, float]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self.calls[run_id] = ("model_calls", time.perf_counter())
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self.calls[run_id] = ("model_calls", time.perf_counter())
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.calls[run_id] = ("tool_calls", time.perf_counter())
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.calls.pop(run_id, None)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.calls.pop(run_id, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Cancelled calls stay in flight, so they are counted once the run is cancelled
+        if not isinstance(error, asyncio.CancelledError):
+            self.calls.pop(run_id, None)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if not isinstance(error, asyncio.CancelledError):
+            self.calls.pop(run_id, None)
+
+    def record_cancelled(self) -> None:
+        """
+        Add the calls still in flight to `cancelled_work`.
+        """
+        now = time.perf_counter()
+        cancelled_work["runs"] += 1
+        for kind, started in self.calls.values():
+            cancelled_work[kind] += 1
+            cancelled_work["call_seconds"] += now - started
+        self.calls.clear()
+
+
+async def finish_cancelled_run(graph: Pregel, thread_id: str) -> None:
+    """
+    Make the checkpoint of a cancelled run safe to continue from.
+
+    Checkpoints are only written between steps, so the state is never half
+    updated, but the nodes that were running are still pending. They are
+    dropped, and tool calls left without a result are answered, so the next
+    user message starts a new turn that the model accepts. A run waiting on
+    an interrupt is left as is: it can still be resumed.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    state = await graph.aget_state(config)
+    if not state.next or any(task.interrupts for task in state.tasks):
+        return
+
+    messages = state.values.get("messages", [])
+    answered = {message.tool_call_id for message in messages if isinstance(message, ToolMessage)}
+    tool_messages = [
+        ToolMessage(content=CANCELLED_TOOL_RESULT, tool_call_id=tool_call["id"])
+        for message in messages if isinstance(message, AIMessage)
+        for tool_call in message.tool_calls if tool_call["id"] not in answered
+    ]
+    if tool_messages:
+        # Written as the node that was cut short, whose tasks are cleared just after
+        await graph.aupdate_state(config, {"messages": tool_messages}, as_node=state.next[0])
+
+    await graph.aupdate_state(config, None, as_node=END)
+
+
+def cancel_run(task: "asyncio.Task[Any]", calls: InFlightCalls, graph: Pregel, thread_id: Optional[str]) -> None:
+    """
+    Cancel a run task without waiting for it, then record the cancelled work
+    and fix up its checkpoint once the task has unwound.
+    """
+    task.cancel()
+
+    def finished(_: "asyncio.Future[Any]") -> None:
+        calls.record_cancelled()
+        if thread_id and graph.checkpointer is not None:
+            cleanup = asyncio.ensure_future(finish_cancelled_run(graph, thread_id))
+            _cleanups.add(cleanup)
+            cleanup.add_done_callback(_cleanup_done)
+
+    task.add_done_callback(finished)
+
+
+def _cleanup_done(cleanup: "asyncio.Future[Any]") -> None:
+    _cleanups.discard(cleanup)
+    if not cleanup.cancelled() and cleanup.exception() is not None:
+        logger.warning("Could not fix up the checkpoint of a cancelled run", exc_info=cleanup.exception())
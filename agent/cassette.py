@@ -0,0 +1,305 @@
+"""
+Record and replay of model calls, for performance runs that do not depend on OpenAI.
+
+While a cassette is set with `models.set_cassette`, every chat model returned
+by `get_chat_model` (chat_node, get_weather, process_steps_node,
+process_insurance_node, ...) goes through a `CassetteChatModel`:
+
+- recording, it calls the real model as a stream and writes the request key
+  and the streamed chunks, each with the delay before it, to the cassette;
+- replaying, it never builds the real model: it finds the recording of the
+  request and streams its chunks back, sleeping the recorded delays times
+  `time_scale` (0 replays instantly, 0.1 ten times faster than recorded).
+
+A request is matched on its model, temperature, bound tools and messages
+(ignoring message ids). Requests whose content varies between runs, e.g.
+after `get_time`, fall back to the last recording with the same shape: the
+same model, tools and sequence of message types.
+
+Cassettes are zstd-compressed JSON lines, one frame per recording, so several
+worker processes can record into the same file. The first line is a header
+with `CASSETTE_VERSION`; cassettes of another version are rejected when
+loaded (`StaleCassette`) and must be recorded again.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+import zstandard
+from langchain_core.callbacks import AsyncCallbackManager, CallbackManager
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Version of the cassette format and of the requests the graphs make. Bump it
+# when a change to the prompts, tools or tool messages of the graphs changes
+# their requests beyond what shape matching recovers from
+CASSETTE_VERSION = 2
+
+# Fields of the streamed chunks that are kept in the cassette. Message ids are
+# not: a replayed message gets a new one, or the messages reducer would
+# replace an earlier reply instead of appending
+CHUNK_FIELDS = ("content", "tool_call_chunks", "response_metadata", "usage_metadata")
+
+
+def as_chunk(message: BaseMessage) -> AIMessageChunk:
+    """
+    Chunk form of a streamed message: models without streaming yield a single whole message.
+    """
+    if isinstance(message, AIMessageChunk):
+        return message
+    tool_call_chunks = [
+        {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+        for index, call in enumerate(getattr(message, "tool_calls", None) or [])
+    ]
+    return AIMessageChunk(
+        id=message.id, content=message.content, tool_call_chunks=tool_call_chunks,
+        response_metadata=message.response_metadata, usage_metadata=getattr(message, "usage_metadata", None),
+    )
+
+
+def _replayed_chunk(fields: Dict[str, Any], call_ids: Dict[str, str]) -> AIMessageChunk:
+    """
+    Rebuild a recorded chunk, with new tool call ids (kept consistent across the chunks of a reply in `call_ids`).
+    """
+    tool_call_chunks = fields.get("tool_call_chunks")
+    if tool_call_chunks:
+        fields = {**fields, "tool_call_chunks": [
+            {**call, "id": call_ids.setdefault(call["id"], f"call_{uuid.uuid4().hex[:24]}") if call.get("id") else None}
+            for call in tool_call_chunks
+        ]}
+    return AIMessageChunk(**fields)
+
+
+class CassetteMiss(LookupError):
+    """
+    A replayed request has no recording.
+    """
+
+
+class StaleCassette(CassetteMiss):
+    """
+    The cassette was recorded by another version (see CASSETTE_VERSION).
+    """
+
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    key: Dict[str, Any] = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        key["tool_calls"] = [[call["name"], call["args"]] for call in message.tool_calls]
+    return key
+
+
+def _message_shape(message: BaseMessage) -> str:
+    if isinstance(message, AIMessage) and message.tool_calls:
+        return "ai:" + ",".join(call["name"] for call in message.tool_calls)
+    if isinstance(message, ToolMessage):
+        return f"tool:{message.name or ''}"
+    return message.type
+
+
+def request_keys(model: str, temperature: Optional[float], tools: Sequence[str], messages: List[BaseMessage]) -> Tuple[str, str]:
+    """
+    The exact key and the shape key of a model request.
+    """
+    exact = json.dumps(
+        [model, temperature, list(tools), [_message_key(message) for message in messages]],
+        sort_keys=True, default=str,
+    )
+    shape = json.dumps([model, temperature, list(tools), [_message_shape(message) for message in messages]])
+    return hashlib.sha256(exact.encode()).hexdigest(), hashlib.sha256(shape.encode()).hexdigest()
+
+
+class Cassette:
+    """
+    Recordings of model calls stored in a file.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", time_scale: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}, expected 'record' or 'replay'")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.shapes: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"recorded": 0, "replayed": 0, "shape_matches": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[str, Optional[float]], "CassetteChatModel"] = {}
+        if mode == "replay":
+            self.load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def load(self) -> None:
+        with open(self.path, "rb") as cassette_file:
+            reader = zstandard.ZstdDecompressor().stream_reader(cassette_file, read_across_frames=True)
+            for number, line in enumerate(io.TextIOWrapper(reader, encoding="utf-8")):
+                recording = json.loads(line)
+                if "cassette_version" in recording or number == 0:
+                    # Header, repeated if several processes created the file at once
+                    version = recording.get("cassette_version")
+                    if version != CASSETTE_VERSION:
+                        raise StaleCassette(
+                            f"{self.path} was recorded by cassette version {version}, expected {CASSETTE_VERSION}"
+                        )
+                    continue
+                self._index(recording)
+
+    def _index(self, recording: Dict[str, Any]) -> None:
+        self.recordings[recording["key"]] = recording
+        self.shapes[recording["shape"]] = recording
+
+    @staticmethod
+    def _frame(value: Dict[str, Any]) -> bytes:
+        return zstandard.ZstdCompressor(level=10).compress(json.dumps(value, separators=(",", ":")).encode() + b"\n")
+
+    def record(self, recording: Dict[str, Any]) -> None:
+        frame = self._frame(recording)
+        with self._lock:
+            self._index(recording)
+            with open(self.path, "ab") as cassette_file:
+                if cassette_file.tell() == 0:
+                    cassette_file.write(self._frame({"cassette_version": CASSETTE_VERSION}))
+                cassette_file.write(frame)
+            self.stats["recorded"] += 1
+
+    def find(self, key: str, shape: str) -> Dict[str, Any]:
+        recording = self.recordings.get(key)
+        if recording is not None:
+            self.stats["replayed"] += 1
+            return recording
+        recording = self.shapes.get(shape)
+        if recording is not None:
+            self.stats["shape_matches"] += 1
+            return recording
+        self.stats["misses"] += 1
+        raise CassetteMiss(f"No recording in {self.path} for this {shape[:12]} request")
+
+    def model(self, model: str, temperature: Optional[float], inner: Optional[BaseChatModel] = None) -> "CassetteChatModel":
+        """
+        The chat model to use instead of `inner` (None when replaying).
+        """
+        cached = self._models.get((model, temperature))
+        if cached is None or cached.inner is not inner:
+            cached = self._models[(model, temperature)] = CassetteChatModel(
+                cassette=self, model_name=model, temperature=temperature, inner=inner
+            )
+        return cached
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Chat model recording the calls of `inner` to a cassette, or replaying them.
+    """
+    cassette: Any
+    model_name: str
+    temperature: Optional[float] = None
+    inner: Optional[BaseChatModel] = None
+    tools: Tuple[Any, ...] = ()
+    tool_names: Tuple[str, ...] = ()
+    tool_kwargs: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "CassetteChatModel":
+        schemas = [tool if isinstance(tool, dict) else convert_to_openai_tool(tool) for tool in tools]
+        return self.model_copy(update={
+            "tools": tuple(tools),
+            "tool_names": tuple(schema.get("function", schema).get("name", "") for schema in schemas),
+            "tool_kwargs": kwargs,
+        })
+
+    def _keys(self, messages: List[BaseMessage]) -> Tuple[str, str]:
+        return request_keys(self.model_name, self.temperature, self.tool_names, messages)
+
+    def _bound_inner(self) -> Any:
+        if self.inner is None:
+            raise CassetteMiss("Cannot record without the model to record")
+        return self.inner.bind_tools(list(self.tools), **self.tool_kwargs) if self.tools else self.inner
+
+    def _recording(self, messages: List[BaseMessage], chunks: List[List[Any]]) -> Dict[str, Any]:
+        key, shape = self._keys(messages)
+        return {"key": key, "shape": shape, "model": self.model_name, "chunks": chunks}
+
+    @staticmethod
+    def _chunk_record(delay: float, chunk: AIMessageChunk) -> List[Any]:
+        fields = {field: getattr(chunk, field) for field in CHUNK_FIELDS if getattr(chunk, field, None)}
+        fields.setdefault("content", "")
+        return [round(delay, 4), fields]
+
+    # The inner model is called without callbacks, so its run does not show up next to this one
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.cassette.replaying:
+            recording = self.cassette.find(*self._keys(messages))
+            call_ids: Dict[str, str] = {}
+            for delay, fields in recording["chunks"]:
+                if self.cassette.time_scale:
+                    await asyncio.sleep(delay * self.cassette.time_scale)
+                chunk = ChatGenerationChunk(message=_replayed_chunk(fields, call_ids))
+                if run_manager is not None:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        chunks: List[List[Any]] = []
+        last = time.perf_counter()
+        config = {"callbacks": AsyncCallbackManager([])}
+        async for message in self._bound_inner().astream(messages, config, stop=stop, **kwargs):
+            message = as_chunk(message)
+            now = time.perf_counter()
+            chunks.append(self._chunk_record(now - last, message))
+            last = now
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self.cassette.record(self._recording(messages, chunks))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.cassette.replaying:
+            recording = self.cassette.find(*self._keys(messages))
+            call_ids: Dict[str, str] = {}
+            for delay, fields in recording["chunks"]:
+                if self.cassette.time_scale:
+                    time.sleep(delay * self.cassette.time_scale)
+                chunk = ChatGenerationChunk(message=_replayed_chunk(fields, call_ids))
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        chunks: List[List[Any]] = []
+        last = time.perf_counter()
+        config = {"callbacks": CallbackManager([])}
+        for message in self._bound_inner().stream(messages, config, stop=stop, **kwargs):
+            message = as_chunk(message)
+            now = time.perf_counter()
+            chunks.append(self._chunk_record(now - last, message))
+            last = now
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self.cassette.record(self._recording(messages, chunks))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
@@ -0,0 +1,177 @@
+"""
+Compact, compressed checkpoint serializer.
+
+Checkpoints of these graphs are dominated by repeated message lists and by a
+few verbose dicts. `CompactSerializer` wraps LangGraph's msgpack serializer:
+- weather reports (and `weather_data` maps of them) and `steps` values are
+  stored as tuples in a fixed field order instead of dicts repeating their keys;
+- payloads above `min_size` bytes are compressed with zstd, using the shared
+  dictionary in `checkpoint.zdict` when it is available.
+
+Pass it to any checkpointer, e.g. `MemorySaver(serde=CompactSerializer())`.
+Everything it writes is self-describing through the type tag and the zstd
+frame header, so values written without the dictionary or by the default
+serializer still load.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+import zstandard
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoint.zdict")
+
+ZSTD_SUFFIX = "+zstd"
+
+
+class WeatherRecord(NamedTuple):
+    """
+    Tuple layout of a weather report built by agent.normalize_weather.
+    """
+    location: Any
+    temperature: Any
+    condition: Any
+    humidity: Any
+    wind_speed: Any
+    wind_direction: Any
+    feels_like: Any
+    visibility: Any
+    uv_index: Any
+    precipitation_chance: Any
+    recommendations: Any
+    clothing_suggestion: Any
+    activity_suggestion: Any
+
+
+class StepRecord(NamedTuple):
+    """
+    Tuple layout of one entry of the HITL `steps` list.
+    """
+    description: Any
+    status: Any
+
+
+# Type tag prefixes of the compact layouts; bump the version when a layout changes
+WEATHER_LAYOUT = "weather_data.v1"
+WEATHER_MAP_LAYOUT = "weather_map.v1"
+STEPS_LAYOUT = "steps.v1"
+
+
+def _is_weather(obj: Any) -> bool:
+    return isinstance(obj, dict) and tuple(obj) == WeatherRecord._fields
+
+
+def _pack(obj: Any) -> Tuple[str, Any]:
+    """
+    Return the layout tag and compact form of `obj`, or ("", obj) if it has none.
+    """
+    if _is_weather(obj):
+        return WEATHER_LAYOUT, tuple(obj.values())
+    if isinstance(obj, dict) and obj and all(_is_weather(report) for report in obj.values()):
+        return WEATHER_MAP_LAYOUT, [(key, tuple(report.values())) for key, report in obj.items()]
+    if (
+        isinstance(obj, list) and obj
+        and all(isinstance(step, dict) and tuple(step) == StepRecord._fields for step in obj)
+    ):
+        return STEPS_LAYOUT, [tuple(step.values()) for step in obj]
+    return "", obj
+
+
+def _unpack(layout: str, obj: Any) -> Any:
+    if layout == WEATHER_LAYOUT:
+        return WeatherRecord(*obj)._asdict()
+    if layout == WEATHER_MAP_LAYOUT:
+        return {key: WeatherRecord(*report)._asdict() for key, report in obj}
+    if layout == STEPS_LAYOUT:
+        return [StepRecord(*step)._asdict() for step in obj]
+    if layout:
+        raise ValueError(f"Unknown checkpoint layout: {layout}")
+    return obj
+
+
+def load_dictionary(path: str = DICTIONARY_PATH) -> Optional[zstandard.ZstdCompressionDict]:
+    """
+    Load the shared zstd dictionary, or None if it has not been trained.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as dictionary_file:
+        return zstandard.ZstdCompressionDict(dictionary_file.read())
+
+
+def train_dictionary(values: Iterable[Any], size: int = 16 * 1024) -> zstandard.ZstdCompressionDict:
+    """
+    Train a zstd dictionary on the serialized form of sample channel values.
+    """
+    serde = JsonPlusSerializer()
+    samples = [serde.dumps_typed(_pack(value)[1])[1] for value in values]
+    return zstandard.train_dictionary(size, samples)
+
+
+class CompactSerializer(SerializerProtocol):
+    """
+    Checkpoint serializer storing compact layouts as zstd-compressed msgpack.
+    """
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        dictionary: Optional[zstandard.ZstdCompressionDict] = None,
+        level: int = 3,
+        min_size: int = 64,
+    ):
+        self.serde = serde or JsonPlusSerializer()
+        self.dictionary = dictionary if dictionary is not None else load_dictionary()
+        self.level = level
+        self.min_size = min_size
+        if self.dictionary is not None:
+            self.dictionary.precompute_compress(level=level)
+        # zstd (de)compressors are not thread-safe, keep one per thread
+        self._local = threading.local()
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self.dictionary
+            )
+        return compressor
+
+    def _decompressor(self, dict_id: int) -> zstandard.ZstdDecompressor:
+        decompressors: Dict[int, zstandard.ZstdDecompressor] = self._local.__dict__.setdefault("decompressors", {})
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id and (self.dictionary is None or self.dictionary.dict_id() != dict_id):
+                raise ValueError(f"Checkpoint was compressed with unknown zstd dictionary {dict_id}")
+            decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(
+                dict_data=self.dictionary if dict_id else None
+            )
+        return decompressor
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.serde.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        layout, obj = _pack(obj)
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= self.min_size:
+            # compress() returns its worst-case sized output buffer, shrunk in length only:
+            # copy the frame so stored checkpoints do not keep that memory
+            type_, data = type_ + ZSTD_SUFFIX, bytes(memoryview(self._compressor().compress(data)))
+        if layout:
+            type_ = f"{layout}:{type_}"
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        layout, _, type_ = type_.rpartition(":")
+        if type_.endswith(ZSTD_SUFFIX):
+            dict_id = zstandard.get_frame_parameters(payload).dict_id
+            payload = self._decompressor(dict_id).decompress(payload)
+            type_ = type_[:-len(ZSTD_SUFFIX)]
+        return _unpack(layout, self.serde.loads_typed((type_, payload)))
@@ -0,0 +1,185 @@
+"""
+Offline stand-ins for the OpenAI chat models.
+
+Used to exercise the graphs without network access, e.g. during warm-up and
+load tests. Install one with `models.use_chat_model(lambda model: StubChatModel())`.
+"""
+
+import asyncio
+import math
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import agenerate_from_stream
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Keyword in the user message -> backend tool the scenario model calls, with its arguments
+SCENARIO_TOOL_CALLS: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    "weather": ("get_weather", {"locations": ["San Francisco"]}),
+    "plan": ("plan_execution_steps", {
+        "steps": [{"description": f"Do step {i + 1}", "status": "enabled"} for i in range(10)],
+    }),
+    "insurance": ("collect_insurance_details", {
+        "details": {
+            "number_of_persons": 4,
+            "budget_range": "$200-$400",
+            "insurance_type": "health",
+            "location": "California",
+        },
+    }),
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Parse a latency distribution in seconds into a sampler:
+    "0.2" or "fixed:0.2", "uniform:LOW,HIGH", "normal:MEAN,STDDEV",
+    "lognormal:MEDIAN,SIGMA" or "exponential:MEAN". Samples are never negative.
+    """
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(value) for value in params.split(",")] if params else []
+    samplers: Dict[str, Callable[..., float]] = {
+        "fixed": lambda value: value,
+        "uniform": random.uniform,
+        "normal": random.gauss,
+        "lognormal": lambda median, sigma: random.lognormvariate(math.log(median), sigma),
+        "exponential": lambda mean: random.expovariate(1 / mean),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    sampler = samplers[kind]
+    return lambda: max(0.0, sampler(*values))
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that answers every prompt with a fixed reply and no tool calls,
+    optionally after a delay drawn from `latency` (see `parse_latency`).
+    """
+    reply: str = "OK"
+    latency: Optional[Callable[[], float]] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat-model"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency is not None:
+            time.sleep(self.latency())
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Without this, BaseChatModel runs _generate in the default thread pool
+        if self.latency is not None:
+            await asyncio.sleep(self.latency())
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage: # pylint: disable=unused-argument
+        return AIMessage(content=self.reply)
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "StubChatModel":
+        # Convert the tools like ChatOpenAI does, so schema generation is exercised
+        for tool in tools:
+            convert_to_openai_tool(tool)
+        return self
+
+
+class ScenarioChatModel(StubChatModel):
+    """
+    Stub model that drives the graphs through their tool flows: when the last
+    message is from the user and mentions a keyword of `tool_calls`, it calls
+    the matching tool if it is bound, otherwise it replies with `reply`.
+    """
+    tool_calls: Dict[str, Tuple[str, Dict[str, Any]]] = SCENARIO_TOOL_CALLS
+    bound_tools: Tuple[str, ...] = ()
+
+    @property
+    def _llm_type(self) -> str:
+        return "scenario-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "ScenarioChatModel":
+        names = tuple(convert_to_openai_tool(tool)["function"]["name"] for tool in tools)
+        return self.model_copy(update={"bound_tools": names})
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        if messages and isinstance(messages[-1], HumanMessage):
+            text = str(messages[-1].content).lower()
+            for keyword, (name, args) in self.tool_calls.items():
+                if keyword in text and name in self.bound_tools:
+                    return AIMessage(content="", tool_calls=[{
+                        "name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:24]}", "type": "tool_call",
+                    }])
+        return AIMessage(content=self.reply)
+
+
+class RamblingChatModel(ScenarioChatModel):
+    """
+    Scenario model whose streamed replies run long: `sections()` `###` sections
+    of `sentences()` sentences each, streamed as 4-character tokens every
+    `token_latency` seconds and cut at `max_tokens` like OpenAI does.
+    """
+    sections: Callable[[], float] = lambda: 4
+    sentences: Callable[[], float] = lambda: 3
+    token_latency: float = 0.02
+
+    @property
+    def _llm_type(self) -> str:
+        return "rambling-chat-model"
+
+    def _text(self) -> str:
+        sections = []
+        for section in range(max(1, round(self.sections()))):
+            sentences = " ".join(
+                f"Sentence {sentence + 1} of option {section + 1} adds some more detail to the answer."
+                for sentence in range(max(1, round(self.sentences())))
+            )
+            sections.append(f"### Option {section + 1}\n{sentences}")
+        return "\n\n".join(sections)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        max_tokens: Optional[int] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self._respond(messages)
+        if reply.tool_calls:
+            from cassette import as_chunk
+            yield ChatGenerationChunk(message=as_chunk(reply))
+            return
+        text = self._text()
+        tokens = [text[index:index + 4] for index in range(0, len(text), 4)]
+        for token in tokens[:max_tokens]:
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        finish_reason = "length" if max_tokens is not None and len(tokens) > max_tokens else "stop"
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", response_metadata={"finish_reason": finish_reason}))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Like OpenAI, a reply takes as long whether it is streamed or not
+        return await agenerate_from_stream(self._astream(messages, stop, run_manager, **kwargs))
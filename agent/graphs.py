@@ -0,0 +1,29 @@
+"""
+Registry of the graphs declared in langgraph.json.
+
+Lets code outside of `langgraph dev` (warm-up, servers, benchmarks) load the
+same graph factories the LangGraph API serves, without duplicating the list.
+"""
+
+import importlib
+import json
+import os
+from typing import Callable, Dict
+from langgraph.pregel import Pregel
+
+LANGGRAPH_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "langgraph.json")
+
+
+def load_graph_factories() -> Dict[str, Callable[[], Pregel]]:
+    """
+    Import every graph module from langgraph.json and return its graph factory by graph id.
+    """
+    with open(LANGGRAPH_CONFIG, encoding="utf-8") as config_file:
+        config = json.load(config_file)
+
+    factories = {}
+    for graph_id, spec in config["graphs"].items():
+        path, variable = spec.rsplit(":", 1)
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        factories[graph_id] = getattr(importlib.import_module(module_name), variable)
+    return factories
@@ -2,18 +2,24 @@
 A LangGraph implementation of the insurance advisor agent with human-in-the-loop functionality.
 """
 
+from functools import lru_cache
 from typing import Dict, List, Any, Annotated, Optional
 import os
 
 # LangGraph imports
 from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, ToolMessage, AIMessage
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END, START
 from langgraph.types import Command, interrupt
 from langgraph.graph import MessagesState
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
+from models import get_chat_model, get_tool_schema
+from output_budget import OutputBudget, bounded_chat_model
+from state_delta import omit_unchanged
+
+# The recommendations are asked for as 3 to 5 `###` sections
+INSURANCE_OUTPUT_BUDGET = OutputBudget("process_insurance_node", max_tokens=1200, max_items=5)
 
 class InsuranceDetails(BaseModel):
     """
@@ -38,6 +44,9 @@ def collect_insurance_details(
     This function MUST be called immediately when users mention insurance needs.
     """
 
+# Tools defined and bound by this agent
+backend_tools = [collect_insurance_details]
+
 class AgentState(MessagesState):
     """
     State of the insurance agent.
@@ -48,17 +57,12 @@ async def start_node(state: Dict[str, Any], config: RunnableConfig): # pylint: d
     """
     This is the entry point for the insurance advisor flow.
     """
-    # Initialize insurance details if not exists
-    if "insurance_details" not in state:
-        state["insurance_details"] = {}
-
-    # Return command to route to chat_node
+    # Initialize insurance details if not exists, only sending keys that change
     return Command(
         goto="chat_node",
-        update={
-            "messages": state["messages"],
-            "insurance_details": state["insurance_details"],
-        }
+        update=omit_unchanged(state, {
+            "insurance_details": state.get("insurance_details", {}),
+        })
     )
 
 async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
@@ -89,7 +93,7 @@ async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
     """
 
     # Define the model
-    model = ChatOpenAI(model="gpt-4o-mini")
+    model = get_chat_model("gpt-4o-mini")
 
     # Define config for the model
     if config is None:
@@ -105,7 +109,7 @@ async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
     # Bind the tools to the model
     model_with_tools = model.bind_tools(
         [
-            collect_insurance_details
+            *[get_tool_schema(backend_tool) for backend_tool in backend_tools]
         ],
         # Disable parallel tool calls to avoid race conditions
         parallel_tool_calls=False,
@@ -117,8 +121,8 @@ async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
         *state["messages"],
     ], config)
 
-    # Update messages with the response
-    messages = state["messages"] + [response]
+    # New messages for this turn, appended by the messages reducer
+    messages = [response]
 
     # Handle tool calls
     if hasattr(response, "tool_calls") and response.tool_calls and len(response.tool_calls) > 0:
@@ -147,15 +151,10 @@ async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
                     goto=END,
                     update={
                         "messages": messages,
-                        "insurance_details": state["insurance_details"],
                     }
                 )
 
-            # Update insurance details in state
-            state["insurance_details"] = insurance_data
-
             # Add a tool response to satisfy OpenAI's requirements
-            from langchain_core.messages import ToolMessage
             tool_response = ToolMessage(
                 content="Insurance details collected successfully.",
                 tool_call_id=tool_call["id"]
@@ -168,7 +167,7 @@ async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
                 goto="process_insurance_node",
                 update={
                     "messages": messages,
-                    "insurance_details": state["insurance_details"],
+                    **omit_unchanged(state, {"insurance_details": insurance_data}),
                 }
             )
 
@@ -177,7 +176,6 @@ async def chat_node(state: AgentState, config: Optional[RunnableConfig] = None):
         goto=END,
         update={
             "messages": messages,
-            "insurance_details": state["insurance_details"],
         }
     )
 
@@ -214,10 +212,10 @@ async def process_insurance_node(state: Dict[str, Any], config: RunnableConfig):
     5. Why this plan fits their needs
     
     Make the recommendations practical, detailed, and tailored to their specific situation.
-    Format the response in a clear, easy-to-read manner.
+    Format the response in a clear, easy-to-read manner, starting each recommendation with a `###` heading.
     """
 
-    final_response = await ChatOpenAI(model="gpt-4o").ainvoke([
+    final_response = await bounded_chat_model(get_chat_model("gpt-4o"), INSURANCE_OUTPUT_BUDGET).ainvoke([
         SystemMessage(content=final_prompt),
         {"role": "user", "content": user_response}
     ], config)
@@ -225,48 +223,69 @@ async def process_insurance_node(state: Dict[str, Any], config: RunnableConfig):
     # Add the final response to messages
     # Ensure the final_response is properly formatted as a LangChain message
     if not hasattr(final_response, 'id'):
-        from langchain_core.messages import AIMessage
         final_response = AIMessage(content=final_response.content)
     
-    messages = state["messages"] + [final_response]
+    messages = [final_response]
 
     # Clear the user_response from state to prepare for future interactions
     if "user_response" in state:
         state.pop("user_response")
 
-    # Return to END with the updated messages
+    # Return to END with the updated messages, insurance details are unchanged
     return Command(
         goto=END,
         update={
             "messages": messages,
-            "insurance_details": state["insurance_details"],
         }
     )
 
-# Define the graph
-workflow = StateGraph(AgentState)
-
-# Add nodes
-workflow.add_node("start_node", start_node)
-workflow.add_node("chat_node", chat_node)
-workflow.add_node("process_insurance_node", process_insurance_node)
-
-# Add edges
-workflow.set_entry_point("start_node")
-workflow.add_edge(START, "start_node")
-workflow.add_edge("start_node", "chat_node")
-workflow.add_edge("process_insurance_node", END)
-
-# Conditionally use a checkpointer based on the environment
-# Check for multiple indicators that we're running in LangGraph dev/API mode
-is_fast_api = os.environ.get("LANGGRAPH_FAST_API", "false").lower() == "true"
-
-# Compile the graph
-if is_fast_api:
-    # For CopilotKit and other contexts, use MemorySaver
-    from langgraph.checkpoint.memory import MemorySaver
-    memory = MemorySaver()
-    graph = workflow.compile(checkpointer=memory)
-else:
-    # When running in LangGraph API/dev, don't use a custom checkpointer
-    graph = workflow.compile()
+def build_graph():
+    """
+    Build and compile the workflow graph.
+    """
+    # Define the graph
+    workflow = StateGraph(AgentState)
+
+    # Add nodes
+    workflow.add_node("start_node", start_node)
+    workflow.add_node("chat_node", chat_node)
+    workflow.add_node("process_insurance_node", process_insurance_node)
+
+    # Add edges
+    workflow.set_entry_point("start_node")
+    workflow.add_edge(START, "start_node")
+    workflow.add_edge("start_node", "chat_node")
+    workflow.add_edge("process_insurance_node", END)
+
+    # Conditionally use a checkpointer based on the environment
+    # Check for multiple indicators that we're running in LangGraph dev/API mode
+    is_fast_api = os.environ.get("LANGGRAPH_FAST_API", "false").lower() == "true"
+
+    # Compile the graph
+    if is_fast_api:
+        # For CopilotKit and other contexts, use MemorySaver
+        from thread_memory import ThreadMemorySaver
+        from checkpoint_serde import CompactSerializer
+        memory = ThreadMemorySaver(serde=CompactSerializer(), name=__name__)
+        return workflow.compile(checkpointer=memory)
+    else:
+        # When running in LangGraph API/dev, don't use a custom checkpointer
+        return workflow.compile()
+
+
+@lru_cache(maxsize=None)
+def get_graph():
+    """
+    Return the compiled graph, compiling it on first use.
+    This is the entry point referenced by langgraph.json.
+    Runs can be profiled on demand, see profiling.py.
+    """
+    from profiling import instrument
+    return instrument(build_graph())
+
+
+def __getattr__(name: str):
+    # Keep `graph` importable for callers that use the compiled graph directly
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,101 @@
+"""
+Shared chat model construction for the agents.
+
+`langchain_openai` pulls in the whole `openai` SDK, which dominates the import
+time of the graph modules. Models are therefore built on first use and cached,
+so a worker only pays for the import when the first request actually needs it.
+
+With a cassette set (see cassette.py), model calls are recorded to it or
+replayed from it instead of reaching OpenAI.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Optional
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_openai import ChatOpenAI
+    from cassette import Cassette
+
+# Factory used instead of ChatOpenAI while set, e.g. for warm-up runs with a stub model
+_model_override: ContextVar[Optional[Callable[[str], "BaseChatModel"]]] = ContextVar(
+    "model_override", default=None
+)
+
+# Process-wide fallback for _model_override, e.g. when serving with a stub model
+_default_model_override: Optional[Callable[[str], "BaseChatModel"]] = None
+
+# Cassette recording or replaying every model call, see set_cassette
+_cassette: Optional["Cassette"] = None
+
+# OpenAI tool schemas of the backend tools, keyed by tool identity
+_tool_schemas: Dict[int, Dict[str, Any]] = {}
+
+
+@lru_cache(maxsize=None)
+def _build_chat_model(model: str, temperature: Optional[float]) -> "ChatOpenAI":
+    from langchain_openai import ChatOpenAI
+
+    if temperature is None:
+        return ChatOpenAI(model=model)
+    return ChatOpenAI(model=model, temperature=temperature)
+
+
+def get_chat_model(model: str, temperature: Optional[float] = None) -> "BaseChatModel":
+    """
+    Return a shared `ChatOpenAI` instance for the given model settings.
+    """
+    override = _model_override.get()
+    if override is not None:
+        # Scoped overrides, e.g. warm-up runs, are neither recorded nor replayed
+        return override(model)
+    if _cassette is not None and _cassette.replaying:
+        return _cassette.model(model, temperature)
+    override = _default_model_override
+    chat_model = override(model) if override is not None else _build_chat_model(model, temperature)
+    if _cassette is not None:
+        return _cassette.model(model, temperature, chat_model)
+    return chat_model
+
+
+@contextmanager
+def use_chat_model(factory: Callable[[str], "BaseChatModel"]) -> Iterator[None]:
+    """
+    Route every `get_chat_model` call in the current context to `factory`.
+    """
+    token = _model_override.set(factory)
+    try:
+        yield
+    finally:
+        _model_override.reset(token)
+
+
+def set_default_chat_model(factory: Optional[Callable[[str], "BaseChatModel"]]) -> None:
+    """
+    Route every `get_chat_model` call in this process to `factory`, or back to OpenAI with None.
+    """
+    global _default_model_override # pylint: disable=global-statement
+    _default_model_override = factory
+
+
+def set_cassette(cassette: Optional["Cassette"]) -> None:
+    """
+    Record every model call in this process to `cassette`, or replay them from it; None stops.
+    """
+    global _cassette # pylint: disable=global-statement
+    _cassette = cassette
+
+
+def get_tool_schema(tool: BaseTool) -> Dict[str, Any]:
+    """
+    Return the OpenAI tool schema of a backend tool, building it once.
+    `bind_tools` passes already converted schemas through unchanged.
+    """
+    schema = _tool_schemas.get(id(tool))
+    if schema is None:
+        schema = _tool_schemas[id(tool)] = convert_to_openai_tool(tool)
+    return schema
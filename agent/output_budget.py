@@ -0,0 +1,187 @@
+"""
+Output budgets for the final-answer model calls.
+
+`process_steps_node` asks for 3 sentences and `process_insurance_node` for up
+to 5 recommendations, but nothing stops a model that keeps going, and the
+final answer is the slowest step of those graphs. An `OutputBudget` bounds a
+node's response in two ways:
+
+- `max_tokens`, derived from the lengths of the node's recent responses: a
+  high percentile with some headroom, so responses rarely hit it, between
+  `min_tokens` and `max_cap`. Until `min_samples` responses were seen, the
+  configured `max_tokens` is used. Responses cut by an early stop are not
+  counted, as their length says nothing about where they would have ended,
+  and `min_tokens` is at least enough for the structural limit
+  (`SENTENCE_TOKENS` per sentence, `SECTION_TOKENS` per section), so the
+  early stop, not `max_tokens`, is what cuts a response that runs long;
+- an early stop: the response is streamed and cut once it has
+  `max_sentences` sentences or `max_items` `###` sections, closing the
+  request instead of waiting for the rest.
+
+`bounded_chat_model(model, budget)` applies a budget to a chat model. Each
+budget counts its calls, the responses truncated by an early stop or by
+`max_tokens`, and an estimate of the latency saved by early stops (reported
+by the server's `/metrics`). How long a response would have gone on is
+learnt from a `holdout_rate` share of the async calls, which are cut and
+returned the same way, while a background task keeps streaming them, up to
+`max_cap`, to measure the tokens past the boundary. Set AGENT_OUTPUT_BUDGET=false to turn budgets off.
+"""
+
+import math
+import os
+import re
+import statistics
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+ENABLED = os.environ.get("AGENT_OUTPUT_BUDGET", "true").lower() == "true"
+
+# End of a sentence, confirmed by the start of the next one
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]*_]*(?=\s+\S)")
+
+# Start of a `###` section (any heading level from 2 down)
+SECTION_START = re.compile(r"^#{2,6}\s", re.MULTILINE)
+
+# Tokens allowed per sentence and per section when bounding min_tokens by the structural limit
+SENTENCE_TOKENS = 40
+SECTION_TOKENS = 150
+
+# Budgets by node name, reported by output_budget_report
+budgets: Dict[str, "OutputBudget"] = {}
+
+
+def estimate_tokens(chars: int, chunks: int) -> int:
+    """
+    Tokens of a streamed response: OpenAI streams about one token per chunk, about 4 characters each.
+    """
+    return max(chunks, math.ceil(chars / 4))
+
+
+def truncation_rate(stats: Dict[str, Any]) -> float:
+    """
+    Share of the calls cut by an early stop (holdouts included) or by `max_tokens`.
+    """
+    truncated = stats["early_stops"] + stats["holdouts"] + stats["length_stops"]
+    return round(truncated / stats["calls"], 4) if stats["calls"] else 0.0
+
+
+class OutputBudget:
+    """
+    Output limits of one node's model call, adapted to its observed response lengths.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_tokens: int,
+        *,
+        max_sentences: Optional[int] = None,
+        max_items: Optional[int] = None,
+        min_tokens: int = 64,
+        max_cap: Optional[int] = None,
+        percentile: float = 0.95,
+        headroom: float = 1.25,
+        min_samples: int = 20,
+        window: int = 200,
+        holdout_rate: float = 0.02,
+    ):
+        self.name = name
+        self.initial_max_tokens = max_tokens
+        self.max_sentences = max_sentences
+        self.max_items = max_items
+        self.min_tokens = max(
+            min_tokens, (max_sentences or 0) * SENTENCE_TOKENS, (max_items or 0) * SECTION_TOKENS
+        )
+        self.max_cap = max_cap or 4 * max_tokens
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.holdout_rate = holdout_rate
+        # Tokens of the recent responses, and tokens the holdout responses went on for past the boundary
+        self.lengths: Deque[int] = deque(maxlen=window)
+        self.overruns: Deque[int] = deque(maxlen=window)
+        self.stats = {
+            "calls": 0, "early_stops": 0, "holdouts": 0, "length_stops": 0, "output_tokens": 0,
+        }
+        # Sum of the seconds per token of the early-stopped responses
+        self._stopped_token_seconds = 0.0
+        self._lock = threading.Lock()
+        budgets[name] = self
+
+    @property
+    def max_tokens(self) -> int:
+        with self._lock:
+            if len(self.lengths) < self.min_samples:
+                return self.initial_max_tokens
+            cutoff = statistics.quantiles(self.lengths, n=100)[round(self.percentile * 100) - 1]
+        return min(self.max_cap, max(self.min_tokens, math.ceil(cutoff * self.headroom)))
+
+    def boundary(self, text: str) -> Optional[int]:
+        """
+        Length of `text` to keep if it went past the structural limit, else None.
+        """
+        if self.max_sentences is not None:
+            ends = [match.end() for match in SENTENCE_END.finditer(text)]
+            if len(ends) >= self.max_sentences:
+                return ends[self.max_sentences - 1]
+        if self.max_items is not None:
+            starts = [match.start() for match in SECTION_START.finditer(text)]
+            if len(starts) > self.max_items:
+                return starts[self.max_items]
+        return None
+
+    def observe(self, tokens: int, seconds: float, stopped_early: bool, hit_limit: bool,
+                overrun: Optional[int] = None) -> None:
+        """
+        Record a response of `tokens` tokens streamed in `seconds`. `overrun` is
+        given for holdout responses cut at the boundary: the tokens that followed.
+        Only the full lengths adapt `max_tokens`: those of the responses that
+        were not stopped early, and of the holdouts with their overrun.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["output_tokens"] += tokens
+            if overrun is not None:
+                self.stats["holdouts"] += 1
+                self.overruns.append(overrun)
+                self.lengths.append(tokens + overrun)
+            elif stopped_early:
+                self.stats["early_stops"] += 1
+                if tokens:
+                    self._stopped_token_seconds += seconds / tokens
+            else:
+                self.lengths.append(tokens)
+                if hit_limit:
+                    self.stats["length_stops"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        # Every early stop saved about the mean overrun of the holdouts, at its own pace
+        overrun = statistics.mean(self.overruns) if self.overruns else 0
+        return {
+            **self.stats,
+            "latency_saved_s": round(self._stopped_token_seconds * overrun, 3),
+            "truncation_rate": truncation_rate(self.stats),
+            "max_tokens": self.max_tokens,
+        }
+
+
+def output_budget_report() -> Dict[str, Dict[str, Any]]:
+    """
+    Counters of every output budget, by node.
+    """
+    return {name: budget.report() for name, budget in budgets.items()}
+
+
+def bounded_chat_model(model: "BaseChatModel", budget: OutputBudget) -> "BaseChatModel":
+    """
+    Return `model` limited to `budget`, or `model` itself when budgets are off.
+    """
+    if not ENABLED:
+        return model
+    # Imported on first use, like the chat models themselves (see models.py)
+    from bounded_model import BoundedChatModel
+    return BoundedChatModel(inner=model, budget=budget)
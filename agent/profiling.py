@@ -0,0 +1,380 @@
+"""
+Opt-in profiling of graph runs.
+
+A run is profiled when its config metadata sets `profile` (AG-UI clients send
+`forwardedProps.profile`), or when AGENT_PROFILE=true profiles every run.
+Each profiled run writes two files to AGENT_PROFILE_DIR:
+
+- `<thread>-<run>.folded`: the stacks sampled while the tasks of the run were
+  executing, in the collapsed format read by flamegraph.pl and speedscope.
+  Samples taken while the event loop was idle, e.g. waiting on the model, are
+  `(idle)`, and samples taken while it ran other requests are `(other tasks)`;
+- `<thread>-<run>.json`: the wall time of the run and, for every node
+  execution, its wall time, the time spent in model and tool calls, and the
+  top allocations tracemalloc saw while the node ran.
+
+tracemalloc cannot tell tasks apart: the allocations of a node are those of
+the whole process between its start and end, including the other requests
+the event loop ran meanwhile. They are only the node's own when the run had
+the process to itself, i.e. when `other_tasks_samples` in the JSON is 0, so
+do not trust them for runs profiled under load.
+
+The graph modules serve their graph through `instrument`. Runs that are not
+profiled only pay for a look at their metadata.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ALL = os.environ.get("AGENT_PROFILE", "false").lower() == "true"
+PROFILE_DIR = os.environ.get("AGENT_PROFILE_DIR", "profiles")
+# Seconds between stack samples
+SAMPLE_INTERVAL = float(os.environ.get("AGENT_PROFILE_INTERVAL", "0.005"))
+# Allocation sites reported per node execution
+TOP_ALLOCATIONS = int(os.environ.get("AGENT_PROFILE_TOP", "10"))
+MAX_STACK_DEPTH = 128
+
+
+class NodeProfile:
+    """
+    One execution of a node within a profiled run.
+    """
+
+    def __init__(self, run_id: UUID, name: str, step: Optional[int]):
+        self.run_id = run_id
+        self.name = name
+        self.step = step
+        self.snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        self.started = time.perf_counter()
+        self.wall_s = 0.0
+        self.model_s = 0.0
+        self.tool_s = 0.0
+        self.allocations: List[Dict[str, Any]] = []
+
+    def finish(self) -> None:
+        self.wall_s = time.perf_counter() - self.started
+        if self.snapshot is None or not tracemalloc.is_tracing():
+            return
+        stats = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")
+        self.snapshot = None
+        # The snapshots themselves are allocated by tracemalloc
+        stats = [stat for stat in stats if stat.size_diff > 0 and stat.traceback[0].filename != tracemalloc.__file__]
+        self.allocations = [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:TOP_ALLOCATIONS]
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "node": self.name,
+            "step": self.step,
+            "wall_s": round(self.wall_s, 6),
+            "model_s": round(self.model_s, 6),
+            "tool_s": round(self.tool_s, 6),
+            "allocations": self.allocations,
+        }
+
+
+class RunProfile:
+    """
+    Samples and node profiles of one profiled run.
+    """
+
+    def __init__(self, run_id: UUID, thread_id: str):
+        self.run_id = run_id
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        # The thread and event loop the run executes on, sampled from the sampler thread
+        self.thread = threading.get_ident()
+        try:
+            self.loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+        # Tasks of the run: the one that started it and every task they create
+        self.tasks: "weakref.WeakSet[asyncio.Task[Any]]" = weakref.WeakSet()
+        self.samples: Counter = Counter()
+        self.nodes: List[NodeProfile] = []
+        self.run_ids: List[UUID] = [run_id]
+
+    def sample(self, frames: Dict[int, Any]) -> None:
+        if self.loop is not None:
+            task = asyncio.current_task(self.loop)
+            if task is None:
+                self.samples["(idle)"] += 1
+                return
+            if task not in self.tasks:
+                self.samples["(other tasks)"] += 1
+                return
+        frame = frames.get(self.thread)
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, directory: str, error: Optional[BaseException]) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.thread_id}-{self.run_id}")
+        with open(f"{path}.folded", "w", encoding="utf-8") as folded:
+            for stack, count in self.samples.most_common():
+                folded.write(f"{stack} {count}\n")
+        summary = {
+            "thread_id": self.thread_id,
+            "run_id": str(self.run_id),
+            "wall_s": round(time.perf_counter() - self.started, 6),
+            "error": repr(error) if error is not None else None,
+            "sample_interval_s": SAMPLE_INTERVAL,
+            "samples": sum(self.samples.values()),
+            # Allocations are diffed process-wide, see the module docstring
+            "allocations_scope": "process",
+            "other_tasks_samples": self.samples["(other tasks)"],
+            "nodes": [node.to_dict() for node in self.nodes],
+        }
+        with open(f"{path}.json", "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        return path
+
+
+class RunProfiler(BaseCallbackHandler):
+    """
+    Callback handler profiling the runs whose metadata sets `profile`.
+
+    Runs are found from their root `on_chain_start`, and the node, model and
+    tool runs below a profiled run are registered as they start. While runs
+    are profiled, a task factory on their event loop adds the tasks created by
+    their tasks to them, so samples taken from the sampler thread can be
+    attributed to a run. Only the event loop thread is sampled: sync code
+    offloaded to the default executor shows up as `(idle)`.
+    """
+    run_inline = True
+
+    def __init__(self, directory: str = PROFILE_DIR, profile_all: bool = PROFILE_ALL):
+        self.directory = directory
+        self.profile_all = profile_all
+        # Profiled run, and node execution if any, of every run id below a profiled run
+        self.runs: Dict[UUID, Any] = {}
+        self.calls: Dict[UUID, float] = {}
+        self.profiles: Dict[UUID, RunProfile] = {}
+        self.lock = threading.Lock()
+        self.sampler: Optional[threading.Thread] = None
+        self.started_tracemalloc = False
+        # Task factory installed on each event loop with profiled runs, and the one it wraps
+        self.factories: Dict[asyncio.AbstractEventLoop, Tuple[Any, Any]] = {}
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        if parent_run_id is None:
+            metadata = metadata or {}
+            if self.profile_all or metadata.get("profile"):
+                self.start(run_id, str(metadata.get("thread_id", "no-thread")))
+            return
+
+        parent = self.runs.get(parent_run_id)
+        if parent is None:
+            return
+        profile, node = parent
+        metadata = metadata or {}
+        name = kwargs.get("name")
+        if node is None and name is not None and name == metadata.get("langgraph_node"):
+            node = NodeProfile(run_id, name, metadata.get("langgraph_step"))
+            profile.nodes.append(node)
+        self.runs[run_id] = (profile, node)
+        profile.run_ids.append(run_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end(run_id, None)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end(run_id, error)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self.start_call(run_id, parent_run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self.start_call(run_id, parent_run_id)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self.start_call(run_id, parent_run_id)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end_call(run_id, "model_s")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end_call(run_id, "model_s")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end_call(run_id, "tool_s")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end_call(run_id, "tool_s")
+
+    def start(self, run_id: UUID, thread_id: str) -> None:
+        profile = RunProfile(run_id, thread_id)
+        if profile.loop is not None:
+            task = asyncio.current_task(profile.loop)
+            if task is not None:
+                profile.tasks.add(task)
+            self.track_tasks(profile.loop)
+        with self.lock:
+            if not self.profiles and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracemalloc = True
+            self.profiles[run_id] = profile
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample, name="run-profiler", daemon=True)
+                self.sampler.start()
+        self.runs[run_id] = (profile, None)
+
+    def end(self, run_id: UUID, error: Optional[BaseException]) -> None:
+        entry = self.runs.get(run_id)
+        if entry is None:
+            return
+        profile, node = entry
+        if run_id != profile.run_id:
+            if node is not None and node.run_id == run_id:
+                node.finish()
+            return
+
+        with self.lock:
+            del self.profiles[run_id]
+            if not self.profiles and self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+        if profile.loop is not None and not any(other.loop is profile.loop for other in self.profiles.values()):
+            self.untrack_tasks(profile.loop)
+        for child in profile.run_ids:
+            self.runs.pop(child, None)
+            self.calls.pop(child, None)
+        try:
+            path = profile.write(self.directory, error)
+            logger.info("Wrote the profile of run %s to %s.{folded,json}", run_id, path)
+        except OSError:
+            logger.warning("Could not write the profile of run %s", run_id, exc_info=True)
+
+    def start_call(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        parent = self.runs.get(parent_run_id) if parent_run_id is not None else None
+        if parent is None:
+            return
+        profile, _ = parent
+        self.runs[run_id] = parent
+        profile.run_ids.append(run_id)
+        self.calls[run_id] = time.perf_counter()
+
+    def end_call(self, run_id: UUID, kind: str) -> None:
+        started = self.calls.pop(run_id, None)
+        if started is None:
+            return
+        _, node = self.runs[run_id]
+        if node is not None:
+            setattr(node, kind, getattr(node, kind) + time.perf_counter() - started)
+
+    def track_tasks(self, loop: asyncio.AbstractEventLoop) -> None:
+        if loop in self.factories:
+            return
+        previous = loop.get_task_factory()
+
+        def factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> "asyncio.Task[Any]":
+            task = previous(loop, coro, **kwargs) if previous is not None else asyncio.Task(coro, loop=loop, **kwargs)
+            parent = asyncio.current_task(loop)
+            if parent is not None:
+                for profile in list(self.profiles.values()):
+                    if parent in profile.tasks:
+                        profile.tasks.add(task)
+                        break
+            return task
+
+        self.factories[loop] = (factory, previous)
+        loop.set_task_factory(factory)
+
+    def untrack_tasks(self, loop: asyncio.AbstractEventLoop) -> None:
+        factory, previous = self.factories.pop(loop, (None, None))
+        # Leave the factory alone if it was replaced in the meantime
+        if factory is not None and loop.get_task_factory() is factory:
+            loop.set_task_factory(previous)
+
+    def sample(self) -> None:
+        """
+        Sampler thread: sample the stack of every profiled run until none is left.
+        """
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            with self.lock:
+                if not self.profiles:
+                    self.sampler = None
+                    return
+                frames = sys._current_frames() # pylint: disable=protected-access
+                for profile in self.profiles.values():
+                    profile.sample(frames)
+
+
+# Shared by every graph, so a single sampler thread serves all profiled runs
+profiler = RunProfiler()
+
+
+def profiled_config(config: Optional[RunnableConfig]) -> Optional[RunnableConfig]:
+    """
+    Add the profiler to the callbacks of a run that should be profiled.
+    """
+    metadata = (config or {}).get("metadata") or {}
+    if not (profiler.profile_all or metadata.get("profile")):
+        return config
+
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if callbacks is None:
+        config["callbacks"] = [profiler]
+    elif isinstance(callbacks, list):
+        if profiler not in callbacks:
+            config["callbacks"] = [*callbacks, profiler]
+    else:
+        manager = callbacks.copy()
+        manager.add_handler(profiler, inherit=True)
+        config["callbacks"] = manager
+    return config
+
+
+class ProfiledStateGraph(CompiledStateGraph):
+    """
+    Compiled graph whose runs can be profiled.
+
+    The profiler is added to the callbacks of the run, since callbacks passed
+    with a run replace those of the graph config. `invoke`, `ainvoke` and
+    `astream_events` go through `stream` and `astream`.
+    """
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]: # pylint: disable=redefined-builtin
+        return super().stream(input, profiled_config(config), **kwargs)
+
+    def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]: # pylint: disable=redefined-builtin
+        return super().astream(input, profiled_config(config), **kwargs)
+
+
+def instrument(graph: CompiledStateGraph) -> ProfiledStateGraph:
+    """
+    Return a copy of the compiled graph whose runs can be profiled.
+    """
+    attrs = {key: value for key, value in graph.__dict__.items() if key != "__orig_class__"}
+    return ProfiledStateGraph(**attrs)
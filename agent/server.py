@@ -0,0 +1,362 @@
+"""
+Multi-process AG-UI server for the graphs declared in langgraph.json.
+
+`langgraph dev` runs every graph in a single process. This server starts N
+worker processes that each serve all graphs over AG-UI with in-memory
+checkpoints, behind a router that always sends a thread to the same worker
+by consistent hashing of its `thread_id`, so checkpoints and caches stay hot.
+
+On shutdown the router stops accepting connections, waits for in-flight runs
+to finish (up to `--drain-timeout` seconds), then stops the workers, which
+drain their own connections the same way.
+
+Usage (from the `agent` directory):
+    python server.py --workers 4 --port 8000
+
+Each graph is served at `POST /agents/<graph_id>`; `GET /ready` reports
+readiness once every worker has finished its warm-up, `GET /metrics` the
+work cancelled because clients disconnected and the truncations of the output
+budgets (see output_budget.py), and `GET /memory?top=10` the
+checkpoint memory and heaviest threads (see thread_memory.py).
+
+Set AGENT_CASSETTE to a cassette file to record every model call to it
+(AGENT_CASSETTE_MODE=record) or serve offline by replaying them (the default,
+AGENT_CASSETTE_TIME_SCALE=0.1 replays ten times faster), see cassette.py.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# Virtual nodes per worker on the hash ring, so threads spread evenly
+RING_REPLICAS = 64
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to worker indexes.
+    Resizing the pool only moves the threads of the added or removed workers.
+    """
+
+    def __init__(self, workers: int, replicas: int = RING_REPLICAS):
+        points = sorted(
+            (self._hash(f"worker-{worker}-{replica}"), worker)
+            for worker in range(workers)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._workers = [worker for _, worker in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def get(self, key: str) -> int:
+        """
+        Return the worker index that owns `key`.
+        """
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._workers[index]
+
+
+def create_worker_app(stub_model: bool = False, stub_latency: str = "0") -> FastAPI:
+    """
+    Build the app of one worker process: every graph served over AG-UI.
+    """
+    os.environ["LANGGRAPH_FAST_API"] = "true"
+
+    import warmup
+    from agui import add_agent_endpoint
+    from cancellation import cancelled_work
+    from output_budget import output_budget_report
+    from graphs import load_graph_factories
+    from thread_memory import thread_memory
+
+    if stub_model:
+        from fake_models import ScenarioChatModel, parse_latency
+        from models import set_default_chat_model
+        stub = ScenarioChatModel(latency=parse_latency(stub_latency))
+        set_default_chat_model(lambda model: stub)
+
+    if os.environ.get("AGENT_CASSETTE"):
+        from cassette import Cassette
+        from models import set_cassette
+        set_cassette(Cassette(
+            os.environ["AGENT_CASSETTE"],
+            os.environ.get("AGENT_CASSETTE_MODE", "replay"),
+            float(os.environ.get("AGENT_CASSETTE_TIME_SCALE", "1")),
+        ))
+
+    factories = load_graph_factories()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI): # pylint: disable=unused-argument
+        await warmup.run_warmup(factories)
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+    for graph_id, factory in factories.items():
+        add_agent_endpoint(app, graph_id, factory(), f"/agents/{graph_id}")
+
+    @app.get("/ready")
+    async def ready():
+        if warmup.is_ready():
+            return {"status": "ready"}
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+
+    @app.get("/metrics")
+    async def metrics():
+        return {"cancelled": cancelled_work, "output_budgets": output_budget_report()}
+
+    @app.get("/memory")
+    async def memory(top: int = 10):
+        return thread_memory.report(top)
+
+    return app
+
+
+def run_worker(port: int, stub_model: bool, stub_latency: str, drain_timeout: int) -> None:
+    """
+    Entry point of a worker process.
+    """
+    uvicorn.run(
+        create_worker_app(stub_model, stub_latency),
+        host="127.0.0.1",
+        port=port,
+        log_level="warning",
+        timeout_graceful_shutdown=drain_timeout,
+    )
+
+
+class WorkerPool:
+    """
+    Starts, supervises and stops the worker processes.
+    """
+
+    def __init__(self, ports: List[int], stub_model: bool, drain_timeout: int, stub_latency: str = "0"):
+        self.ports = ports
+        self.stub_model = stub_model
+        self.stub_latency = stub_latency
+        self.drain_timeout = drain_timeout
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * len(ports)
+        self.stopping = False
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self, index: int) -> None:
+        """
+        Start (or restart) the worker at `index` on its fixed port.
+        """
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.ports[index], self.stub_model, self.stub_latency, self.drain_timeout),
+            name=f"agent-worker-{index}",
+            daemon=False,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start_all(self) -> None:
+        for index in range(len(self.ports)):
+            self.start(index)
+
+    async def supervise(self, interval: float = 1.0) -> None:
+        """
+        Restart workers that died. A restarted worker keeps its port and its
+        share of the hash ring, but loses its in-memory checkpoints.
+        """
+        while not self.stopping:
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive() and not self.stopping:
+                    logger.warning("Worker %d exited with code %s, restarting", index, process.exitcode)
+                    self.start(index)
+            await asyncio.sleep(interval)
+
+    def stop_all(self) -> None:
+        """
+        Ask every worker to drain and exit, killing the ones that do not.
+        """
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(self.drain_timeout + 5)
+                if process.is_alive():
+                    logger.warning("Worker %s did not drain in time, killing it", process.name)
+                    process.kill()
+
+
+def create_router_app(pool: WorkerPool) -> FastAPI:
+    """
+    Build the front app that routes each run to the worker owning its thread.
+    """
+    from output_budget import truncation_rate
+
+    ring = HashRing(len(pool.ports))
+    clients: List[httpx.AsyncClient] = []
+    in_flight = 0
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI): # pylint: disable=unused-argument
+        clients.extend(
+            httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=httpx.Timeout(10.0, read=None))
+            for port in pool.ports
+        )
+        supervisor = asyncio.create_task(pool.supervise())
+        yield
+        # Uvicorn has already waited for the in-flight runs at this point
+        if in_flight:
+            logger.warning("Shutting down with %d runs still in flight", in_flight)
+        supervisor.cancel()
+        for client in clients:
+            await client.aclose()
+        await asyncio.to_thread(pool.stop_all)
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.post("/agents/{graph_id}")
+    async def route_run(graph_id: str, request: Request):
+        nonlocal in_flight
+
+        body = await request.json()
+        thread_id = body.get("threadId") or body.get("thread_id")
+        if not thread_id:
+            # Pin new threads here, so the worker and the client agree on the id
+            thread_id = body["threadId"] = str(uuid.uuid4())
+        worker = ring.get(thread_id)
+
+        client = clients[worker]
+        upstream_request = client.build_request(
+            "POST",
+            f"/agents/{graph_id}",
+            content=json.dumps(body),
+            headers={
+                "content-type": "application/json",
+                "accept": request.headers.get("accept", "text/event-stream"),
+            },
+        )
+        try:
+            upstream = await client.send(upstream_request, stream=True)
+        except httpx.TransportError as e:
+            logger.warning("Worker %d unavailable: %s", worker, e)
+            return JSONResponse({"detail": "worker unavailable"}, status_code=503)
+
+        in_flight += 1
+
+        async def finish():
+            nonlocal in_flight
+            in_flight -= 1
+            await upstream.aclose()
+
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            media_type=upstream.headers.get("content-type"),
+            headers={"x-agent-worker": str(worker)},
+            background=BackgroundTask(finish),
+        )
+
+    @app.get("/ready")
+    async def ready():
+        statuses: Dict[int, bool] = {}
+        for index, client in enumerate(clients):
+            try:
+                statuses[index] = (await client.get("/ready")).status_code == 200
+            except httpx.TransportError:
+                statuses[index] = False
+        status_code = 200 if statuses and all(statuses.values()) else 503
+        return JSONResponse({"workers": statuses, "in_flight": in_flight}, status_code=status_code)
+
+    @app.get("/metrics")
+    async def metrics():
+        # Sum of the worker metrics, skipping workers that are down
+        cancelled: Dict[str, float] = {}
+        output_budgets: Dict[str, Dict[str, float]] = {}
+        for client in clients:
+            try:
+                worker_metrics = (await client.get("/metrics")).json()
+            except httpx.TransportError:
+                continue
+            for key, value in worker_metrics["cancelled"].items():
+                cancelled[key] = cancelled.get(key, 0) + value
+            for node, budget in worker_metrics["output_budgets"].items():
+                totals = output_budgets.setdefault(node, {})
+                for key, value in budget.items():
+                    # Every worker adapts its own max_tokens, report the largest
+                    totals[key] = max(totals.get(key, 0), value) if key == "max_tokens" else totals.get(key, 0) + value
+        for totals in output_budgets.values():
+            totals["truncation_rate"] = truncation_rate(totals)
+        return {"in_flight": in_flight, "cancelled": cancelled, "output_budgets": output_budgets}
+
+    @app.get("/memory")
+    async def memory(top: int = 10):
+        # Totals of the worker reports, and the heaviest threads across workers
+        totals: Dict[str, int] = {}
+        threads: List[Dict] = []
+        for index, client in enumerate(clients):
+            try:
+                report = (await client.get("/memory", params={"top": top})).json()
+            except httpx.TransportError:
+                continue
+            threads.extend({**thread, "worker": index} for thread in report.pop("top_threads"))
+            for key, value in report.items():
+                totals[key] = totals.get(key, 0) + value
+        threads.sort(key=lambda thread: thread["bytes"], reverse=True)
+        return {**totals, "top_threads": threads[:top]}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Multi-process AG-UI server for the agent graphs")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--worker-base-port", type=int, default=None,
+                        help="first worker port, workers listen on 127.0.0.1 (default: --port + 1)")
+    parser.add_argument("--drain-timeout", type=int, default=30,
+                        help="seconds to wait for in-flight runs on shutdown")
+    parser.add_argument("--stub-model", action="store_true",
+                        help="answer with a stub model instead of OpenAI (load testing)")
+    parser.add_argument("--stub-latency", default="0",
+                        help="latency distribution of the stub model, e.g. lognormal:0.5,0.4 (see fake_models.parse_latency)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    base_port = args.worker_base_port or args.port + 1
+    pool = WorkerPool(
+        ports=[base_port + index for index in range(args.workers)],
+        stub_model=args.stub_model,
+        drain_timeout=args.drain_timeout,
+        stub_latency=args.stub_latency,
+    )
+    pool.start_all()
+    try:
+        uvicorn.run(
+            create_router_app(pool),
+            host=args.host,
+            port=args.port,
+            timeout_graceful_shutdown=args.drain_timeout,
+        )
+    finally:
+        pool.stop_all()
+
+
+if __name__ == "__main__":
+    main()
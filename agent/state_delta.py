@@ -0,0 +1,80 @@
+"""
+Incremental shared-state updates.
+
+Nodes used to re-send whole state objects (`weather_data`, `steps`,
+`insurance_details`) on every update, and AG-UI clients received a full
+STATE_SNAPSHOT after each of them. This module provides:
+- `omit_unchanged`, which drops unchanged keys from a `Command.update`;
+- `compute_state_delta`, which diffs two shared states into an RFC 6902 patch
+  (streamed to AG-UI clients as STATE_DELTA events, see `agui.py`).
+"""
+
+from typing import Any, Dict, List, Mapping
+import jsonpatch
+
+
+def omit_unchanged(state: Mapping[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return `update` without the keys whose value already equals the current state.
+    Keys missing from the state are always kept.
+    """
+    return {
+        key: value for key, value in update.items()
+        if key not in state or state[key] != value
+    }
+
+
+def _pointer(path: str, key: Any) -> str:
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def compute_state_delta(
+    previous: Mapping[str, Any],
+    current: Mapping[str, Any],
+    path: str = "",
+) -> List[Dict[str, Any]]:
+    """
+    Return the RFC 6902 operations that turn `previous` into `current`.
+    Both states must be JSON-compatible.
+
+    Objects and equally long lists are diffed item by item and lists that only
+    grew (like `messages`) become plain appends, so the cost scales with what
+    changed rather than with the size of the state. Other list changes fall
+    back to jsonpatch.
+    """
+    operations: List[Dict[str, Any]] = [
+        {"op": "remove", "path": _pointer(path, key)}
+        for key in previous if key not in current
+    ]
+
+    for key, value in current.items():
+        pointer = _pointer(path, key)
+        if key not in previous:
+            operations.append({"op": "add", "path": pointer, "value": value})
+            continue
+
+        old = previous[key]
+        if old == value:
+            continue
+
+        if isinstance(old, dict) and isinstance(value, dict):
+            operations.extend(compute_state_delta(old, value, pointer))
+        elif isinstance(old, list) and isinstance(value, list):
+            if len(value) > len(old) and value[:len(old)] == old:
+                operations.extend(
+                    {"op": "add", "path": _pointer(pointer, index), "value": item}
+                    for index, item in enumerate(value[len(old):], start=len(old))
+                )
+            elif len(value) == len(old):
+                operations.extend(compute_state_delta(dict(enumerate(old)), dict(enumerate(value)), pointer))
+            else:
+                operations.extend(
+                    {**operation, "path": pointer + operation["path"], **(
+                        {"from": pointer + operation["from"]} if "from" in operation else {}
+                    )}
+                    for operation in jsonpatch.make_patch(old, value).patch
+                )
+        else:
+            operations.append({"op": "replace", "path": pointer, "value": value})
+
+    return operations
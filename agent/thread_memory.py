@@ -0,0 +1,314 @@
+"""
+Per-thread memory accounting and eviction for the in-memory checkpointer.
+
+With `MemorySaver`, every checkpoint of every thread stays in the worker for
+its lifetime, so one runaway session can push it toward OOM.
+`ThreadMemorySaver` is the `MemorySaver` the graphs use when they keep their
+own checkpoints. It tracks the approximate size of the checkpoints, pending
+writes and channel blobs of each thread, and reports them to the
+process-wide `thread_memory`, which:
+
+- lists the heaviest threads (`top_threads`, served at `GET /memory`);
+- enforces a global budget (AGENT_MEMORY_BUDGET_MB, unlimited by default) by
+  offloading the least recently used threads to AGENT_OFFLOAD_DIR. An
+  offloaded thread is loaded back on its next access, so runs continue
+  where they left off. With AGENT_MEMORY_EVICTION=drop, evicted threads are
+  deleted instead.
+
+The thread being written is never evicted by its own write, so a single
+thread larger than the budget stays resident while it is in use.
+"""
+
+import atexit
+import hashlib
+import heapq
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import ormsgpack
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+logger = logging.getLogger(__name__)
+
+# Bytes of the keys, tuples and type tags around each stored payload, as
+# measured with tracemalloc on weather sessions
+ENTRY_OVERHEAD = 450
+
+
+class ThreadMemory:
+    """
+    Resident size and recency of the threads of every `ThreadMemorySaver` in
+    the process, and the global budget they share.
+    """
+
+    def __init__(self, budget_bytes: int = 0, eviction: str = "offload", offload_dir: Optional[str] = None):
+        if eviction not in ("offload", "drop"):
+            raise ValueError(f"Unknown eviction mode {eviction!r}, expected 'offload' or 'drop'")
+        self.budget_bytes = budget_bytes
+        self.eviction = eviction
+        self.offload_dir = offload_dir or os.path.join(tempfile.gettempdir(), "agent-offload")
+        self.savers: List["ThreadMemorySaver"] = []
+        # Last access of every resident thread, least recent first
+        self.recent: "OrderedDict[str, float]" = OrderedDict()
+        self.evictions = {"offloaded": 0, "restored": 0, "dropped": 0}
+        self.lock = threading.RLock()
+        self._warned: Set[str] = set()
+
+    def register(self, saver: "ThreadMemorySaver") -> None:
+        self.savers.append(saver)
+
+    def touch(self, thread_id: str) -> None:
+        self.recent[thread_id] = time.monotonic()
+        self.recent.move_to_end(thread_id)
+
+    def forget(self, thread_id: str) -> None:
+        self.recent.pop(thread_id, None)
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(saver.total_bytes for saver in self.savers)
+
+    def thread_bytes(self, thread_id: str) -> int:
+        return sum(saver.thread_bytes.get(thread_id, 0) for saver in self.savers)
+
+    def process_dir(self) -> str:
+        """
+        Offload directory of this process, removed when it exits.
+        """
+        path = os.path.join(self.offload_dir, str(os.getpid()))
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+            atexit.register(shutil.rmtree, path, True)
+        return path
+
+    def enforce(self, active_thread: str) -> None:
+        """
+        Evict the least recently used threads, other than `active_thread`,
+        until the resident size fits the budget.
+        """
+        if not self.budget_bytes:
+            return
+        with self.lock:
+            while self.resident_bytes > self.budget_bytes:
+                victim = next((thread_id for thread_id in self.recent if thread_id != active_thread), None)
+                if victim is None:
+                    if active_thread not in self._warned:
+                        self._warned.add(active_thread)
+                        logger.warning(
+                            "Thread %s alone holds %d bytes of checkpoints, over the %d byte budget",
+                            active_thread, self.thread_bytes(active_thread), self.budget_bytes,
+                        )
+                    return
+                del self.recent[victim]
+                for saver in self.savers:
+                    saver.evict(victim, offload=self.eviction == "offload")
+                self.evictions["offloaded" if self.eviction == "offload" else "dropped"] += 1
+
+    def top_threads(self, k: int = 10) -> List[Dict[str, Any]]:
+        """
+        The `k` resident threads holding the most memory.
+        """
+        with self.lock:
+            now = time.monotonic()
+            sizes = [(self.thread_bytes(thread_id), thread_id, accessed) for thread_id, accessed in self.recent.items()]
+        return [
+            {"thread_id": thread_id, "bytes": size, "idle_s": round(now - accessed, 1)}
+            for size, thread_id, accessed in heapq.nlargest(k, sizes)
+        ]
+
+    def report(self, k: int = 10) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": self.resident_bytes,
+                "resident_threads": len(self.recent),
+                "offloaded_threads": sum(len(saver.offloaded) for saver in self.savers),
+                **self.evictions,
+                "top_threads": self.top_threads(k),
+            }
+
+
+thread_memory = ThreadMemory(
+    budget_bytes=int(float(os.environ.get("AGENT_MEMORY_BUDGET_MB", "0")) * 1024 * 1024),
+    eviction=os.environ.get("AGENT_MEMORY_EVICTION", "offload"),
+    offload_dir=os.environ.get("AGENT_OFFLOAD_DIR"),
+)
+
+
+def _checkpoint_size(entry: Optional[Tuple[Any, Any, Any]]) -> int:
+    return len(entry[0][1]) + len(entry[1][1]) + ENTRY_OVERHEAD if entry else 0
+
+
+def _write_size(entry: Tuple[str, str, Any, str]) -> int:
+    return len(entry[2][1]) + ENTRY_OVERHEAD
+
+
+def _blob_size(blob: Optional[Tuple[str, bytes]]) -> int:
+    return len(blob[1]) + ENTRY_OVERHEAD if blob else 0
+
+
+class ThreadMemorySaver(MemorySaver):
+    """
+    `MemorySaver` that accounts the memory of each thread and can move a
+    thread out of memory and back.
+
+    `name` keeps the offloaded files of the savers of different graphs apart.
+    Listing checkpoints without a thread only covers resident threads.
+    """
+
+    def __init__(self, *, name: str, serde: Optional[SerializerProtocol] = None, memory: Optional[ThreadMemory] = None):
+        super().__init__(serde=serde)
+        self.name = name
+        self.memory = memory or thread_memory
+        self.thread_bytes: Dict[str, int] = {}
+        self.total_bytes = 0
+        # Keys of the pending writes and blobs of each thread, so a thread is removed without a full scan
+        self.write_keys: Dict[str, Set[Tuple[str, str, str]]] = defaultdict(set)
+        self.blob_keys: Dict[str, Set[Tuple[str, str, str, Any]]] = defaultdict(set)
+        # Offload file of each offloaded thread
+        self.offloaded: Dict[str, str] = {}
+        self.memory.register(self)
+
+    def _account(self, thread_id: str, delta: int) -> None:
+        self.thread_bytes[thread_id] = self.thread_bytes.get(thread_id, 0) + delta
+        self.total_bytes += delta
+
+    def _access(self, thread_id: str) -> None:
+        if thread_id in self.offloaded:
+            self._restore(thread_id)
+            self.memory.touch(thread_id)
+            self.memory.enforce(thread_id)
+        elif thread_id in self.thread_bytes:
+            self.memory.touch(thread_id)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self.memory.lock:
+            self._access(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, # pylint: disable=redefined-builtin
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        if config:
+            with self.memory.lock:
+                self._access(config["configurable"]["thread_id"])
+        yield from super().list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        blob_keys = [(thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items()]
+        with self.memory.lock:
+            self._access(thread_id)
+            checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns, {})
+            before = _checkpoint_size(checkpoints.get(checkpoint["id"])) + sum(_blob_size(self.blobs.get(key)) for key in blob_keys)
+            result = super().put(config, checkpoint, metadata, new_versions)
+            after = _checkpoint_size(self.storage[thread_id][checkpoint_ns][checkpoint["id"]]) + sum(_blob_size(self.blobs[key]) for key in blob_keys)
+            self.blob_keys[thread_id].update(blob_keys)
+            self._account(thread_id, after - before)
+            self.memory.touch(thread_id)
+            self.memory.enforce(thread_id)
+        return result
+
+    def put_writes(self, config: RunnableConfig, writes: Any, task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        outer_key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        with self.memory.lock:
+            self._access(thread_id)
+            before = sum(_write_size(entry) for entry in self.writes.get(outer_key, {}).values())
+            super().put_writes(config, writes, task_id, task_path)
+            after = sum(_write_size(entry) for entry in self.writes.get(outer_key, {}).values())
+            self.write_keys[thread_id].add(outer_key)
+            self._account(thread_id, after - before)
+            self.memory.touch(thread_id)
+            self.memory.enforce(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.memory.lock:
+            self._remove(thread_id)
+            path = self.offloaded.pop(thread_id, None)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            if not any(thread_id in saver.thread_bytes or thread_id in saver.offloaded for saver in self.memory.savers):
+                self.memory.forget(thread_id)
+
+    def _remove(self, thread_id: str) -> Dict[str, Any]:
+        """
+        Take the entries of a thread out of memory and return them.
+        """
+        removed = {
+            "storage": self.storage.pop(thread_id, {}),
+            "writes": {key: self.writes.pop(key) for key in self.write_keys.pop(thread_id, ()) if key in self.writes},
+            "blobs": {key: self.blobs.pop(key) for key in self.blob_keys.pop(thread_id, ()) if key in self.blobs},
+        }
+        self.total_bytes -= self.thread_bytes.pop(thread_id, 0)
+        return removed
+
+    def evict(self, thread_id: str, offload: bool) -> None:
+        """
+        Move a thread out of memory: to the offload directory, or nowhere.
+        """
+        if thread_id not in self.thread_bytes:
+            return
+        removed = self._remove(thread_id)
+        if not offload:
+            return
+
+        payload = {
+            "storage": {
+                checkpoint_ns: {
+                    checkpoint_id: [list(checkpoint), list(metadata), parent]
+                    for checkpoint_id, (checkpoint, metadata, parent) in checkpoints.items()
+                }
+                for checkpoint_ns, checkpoints in removed["storage"].items()
+            },
+            "writes": [
+                [checkpoint_ns, checkpoint_id, inner_task, index, task_id, channel, list(value), task_path]
+                for (_, checkpoint_ns, checkpoint_id), writes in removed["writes"].items()
+                for (inner_task, index), (task_id, channel, value, task_path) in writes.items()
+            ],
+            "blobs": [
+                [checkpoint_ns, channel, version, list(blob)]
+                for (_, checkpoint_ns, channel, version), blob in removed["blobs"].items()
+            ],
+        }
+        directory = os.path.join(self.memory.process_dir(), self.name)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, hashlib.sha256(thread_id.encode()).hexdigest())
+        with open(path, "wb") as offload_file:
+            offload_file.write(ormsgpack.packb(payload))
+        self.offloaded[thread_id] = path
+
+    def _restore(self, thread_id: str) -> None:
+        path = self.offloaded.pop(thread_id)
+        with open(path, "rb") as offload_file:
+            payload = ormsgpack.unpackb(offload_file.read())
+        os.remove(path)
+
+        size = 0
+        for checkpoint_ns, checkpoints in payload["storage"].items():
+            for checkpoint_id, (checkpoint, metadata, parent) in checkpoints.items():
+                entry = (tuple(checkpoint), tuple(metadata), parent)
+                self.storage[thread_id][checkpoint_ns][checkpoint_id] = entry
+                size += _checkpoint_size(entry)
+        for checkpoint_ns, checkpoint_id, inner_task, index, task_id, channel, value, task_path in payload["writes"]:
+            outer_key = (thread_id, checkpoint_ns, checkpoint_id)
+            entry = (task_id, channel, tuple(value), task_path)
+            self.writes[outer_key][(inner_task, index)] = entry
+            self.write_keys[thread_id].add(outer_key)
+            size += _write_size(entry)
+        for checkpoint_ns, channel, version, blob in payload["blobs"]:
+            key = (thread_id, checkpoint_ns, channel, version)
+            self.blobs[key] = tuple(blob)
+            self.blob_keys[thread_id].add(key)
+            size += _blob_size(self.blobs[key])
+        self._account(thread_id, size)
+        self.memory.evictions["restored"] += 1
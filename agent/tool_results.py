@@ -0,0 +1,128 @@
+"""
+Compact tool results, rendered for people only at the UI edge.
+
+Tool messages stay in the message history: they are stored in every later
+checkpoint and sent back to the model on every turn. Backend tools therefore
+answer with compact canonical JSON (`tool_payload`), and the AG-UI endpoint
+renders it as Markdown for the chat with the renderer the tool registered
+(`register_tool_result`, `render_tool_result`). When the graphs are served by
+the LangGraph API instead (`langgraph dev`, LANGGRAPH_FAST_API unset), no
+endpoint of ours renders the results, so `tool_result` keeps them rendered,
+with the compact payload as the message artifact.
+
+With AGENT_COLLAPSE_TOOL_RESULTS=N, the results of tools that registered a
+summary are replaced in the history by that summary once they are more than
+N user turns old (`collapse_tool_results`), on both paths. 0, the default,
+keeps them whole.
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+COLLAPSE_AFTER_TURNS = int(os.environ.get("AGENT_COLLAPSE_TOOL_RESULTS", "0"))
+
+# Key of the payload replacing a collapsed tool result
+COLLAPSED_KEY = "collapsed"
+
+# Markdown renderers and one-line summaries of the tool payloads, by tool name
+_renderers: Dict[str, Callable[[Any], str]] = {}
+_summarizers: Dict[str, Callable[[Any], str]] = {}
+
+
+def register_tool_result(name: str, render: Callable[[Any], str], summarize: Optional[Callable[[Any], str]] = None) -> None:
+    """
+    Register how to render the payload of tool `name` for the chat, and optionally how to summarize it.
+    """
+    _renderers[name] = render
+    if summarize is not None:
+        _summarizers[name] = summarize
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items() if item not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_compact(item) for item in value]
+    return value
+
+
+def tool_payload(value: Any) -> str:
+    """
+    Canonical JSON of a tool result: no empty fields, no whitespace, no escaped Unicode.
+    """
+    return json.dumps(_compact(value), ensure_ascii=False, separators=(",", ":"))
+
+
+def _load(content: Any) -> Any:
+    if not isinstance(content, str):
+        return None
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def render_tool_result(name: Optional[str], content: Any) -> Any:
+    """
+    Markdown of a tool result for the chat, or `content` unchanged if the tool has no renderer.
+    """
+    renderer = _renderers.get(name or "")
+    payload = _load(content) if renderer is not None else None
+    if payload is None:
+        return content
+    if isinstance(payload, dict) and COLLAPSED_KEY in payload:
+        return payload[COLLAPSED_KEY]
+    return renderer(payload)
+
+
+def _rendered_at_edge() -> bool:
+    return os.environ.get("LANGGRAPH_FAST_API", "false").lower() == "true"
+
+
+def tool_result(name: str, payload: str) -> Tuple[str, Optional[str]]:
+    """
+    Content and artifact of the tool message for `payload`: the payload itself
+    when the AG-UI endpoint renders it for the chat, else its Markdown, with
+    the payload kept as the artifact for `collapse_tool_results`.
+    """
+    if _rendered_at_edge():
+        return payload, None
+    return render_tool_result(name, payload), payload
+
+
+def collapse_tool_results(messages: Sequence[BaseMessage], keep_turns: Optional[int] = None) -> List[ToolMessage]:
+    """
+    Summaries replacing the tool results older than the last `keep_turns` user
+    turns (default COLLAPSE_AFTER_TURNS), as tool messages with the same ids,
+    ready for the messages reducer.
+    """
+    if keep_turns is None:
+        keep_turns = COLLAPSE_AFTER_TURNS
+    if keep_turns <= 0:
+        return []
+    turns = [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if len(turns) <= keep_turns:
+        return []
+
+    names: Dict[str, str] = {}
+    collapsed = []
+    for message in messages[:turns[-keep_turns]]:
+        if isinstance(message, AIMessage):
+            names.update((call["id"], call["name"]) for call in message.tool_calls)
+        elif isinstance(message, ToolMessage):
+            name = message.name or names.get(message.tool_call_id, "")
+            if name not in _summarizers:
+                continue
+            # Rendered results carry their payload as the artifact
+            payload = _load(message.content)
+            if payload is None:
+                payload = _load(message.artifact)
+            if payload is None or (isinstance(payload, dict) and COLLAPSED_KEY in payload):
+                continue
+            summary = _summarizers[name](payload)
+            # Shown as is when nothing renders it for the chat
+            content = tool_payload({COLLAPSED_KEY: summary}) if _rendered_at_edge() else summary
+            collapsed.append(message.model_copy(update={"content": content, "artifact": None}))
+    return collapsed
@@ -0,0 +1,142 @@
+"""
+Warm-up hook that runs before the server reports ready.
+
+The first request after a deploy would otherwise pay for graph compilation,
+tool schema generation, the TLS handshake with OpenAI and loading the pytz
+database all at once. `run_warmup` does that work up front and flips the
+readiness signal returned by `is_ready` once it has finished.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Callable, Dict, Optional
+import pytz
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.pregel import Pregel
+from fake_models import StubChatModel
+from models import _build_chat_model, get_tool_schema, use_chat_model
+
+logger = logging.getLogger(__name__)
+
+# (model, temperature) pairs requested by the graphs and tools
+WARMUP_MODELS = [
+    ("gpt-4o", None),
+    ("gpt-4o", 0.3),
+    ("gpt-4o-mini", None),
+]
+
+# Timezone names get_time resolves for the common abbreviations
+WARMUP_TIMEZONES = [
+    "UTC",
+    "America/New_York",
+    "America/Los_Angeles",
+    "America/Chicago",
+]
+
+_ready = False
+
+
+def is_ready() -> bool:
+    """
+    Return True once warm-up has completed.
+    """
+    return _ready
+
+
+def prebuild_tool_schemas(factories: Dict[str, Callable[[], Pregel]]) -> int:
+    """
+    Build the OpenAI schemas of the backend tools of every graph module.
+    """
+    count = 0
+    for factory in factories.values():
+        module = sys.modules[factory.__module__]
+        for tool in getattr(module, "backend_tools", []):
+            get_tool_schema(tool)
+            count += 1
+    return count
+
+
+def load_timezones() -> int:
+    """
+    Load the pytz zone files get_time is most likely to need.
+    """
+    names = set(WARMUP_TIMEZONES) | set(pytz.common_timezones)
+    for name in names:
+        pytz.timezone(name)
+    return len(names)
+
+
+async def open_connections() -> int:
+    """
+    Build the shared chat models and open pooled connections to the OpenAI API.
+
+    A cheap `models.list` request primes both the sync and async HTTP pools.
+    Point `OPENAI_BASE_URL` at a local stub to run this offline.
+    Failures are logged and skipped: the first real request will retry them.
+    """
+    async def prime(model: str, temperature: Optional[float]) -> bool:
+        try:
+            chat_model = _build_chat_model(model, temperature)
+            await chat_model.root_async_client.with_options(max_retries=0).models.list()
+            await asyncio.to_thread(chat_model.root_client.with_options(max_retries=0).models.list)
+            return True
+        except Exception as e: # pylint: disable=broad-except
+            logger.warning("Could not open connections for %s: %s", model, e)
+            return False
+
+    primed = await asyncio.gather(*(prime(model, temperature) for model, temperature in WARMUP_MODELS))
+    return sum(primed)
+
+
+async def run_graph_turns(factories: Dict[str, Callable[[], Pregel]]) -> None:
+    """
+    Compile every graph and run one turn through it against a stub model.
+    The warm-up threads are deleted afterwards, so they do not count against
+    the memory budget or show in `/memory`.
+    """
+    with use_chat_model(lambda model: StubChatModel()):
+        for graph_id, factory in factories.items():
+            graph = factory()
+            thread_id = f"warmup-{graph_id}"
+            try:
+                await graph.ainvoke(
+                    {"messages": [HumanMessage(content="Hello")], "tools": []},
+                    {"configurable": {"thread_id": thread_id}},
+                )
+            finally:
+                if isinstance(graph.checkpointer, BaseCheckpointSaver):
+                    await graph.checkpointer.adelete_thread(thread_id)
+
+
+async def run_warmup(factories: Optional[Dict[str, Callable[[], Pregel]]] = None) -> Dict[str, float]:
+    """
+    Run every warm-up phase and mark the server as ready.
+    Returns the duration of each phase in milliseconds.
+    """
+    global _ready # pylint: disable=global-statement
+
+    if factories is None:
+        from graphs import load_graph_factories
+        factories = load_graph_factories()
+
+    timings = {}
+
+    async def timed(name, phase):
+        started = time.perf_counter()
+        result = phase()
+        if asyncio.iscoroutine(result):
+            result = await result
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    await timed("tool_schemas", lambda: prebuild_tool_schemas(factories))
+    await timed("timezones", load_timezones)
+    await timed("connections", open_connections)
+    await timed("graphs", lambda: run_graph_turns(factories))
+
+    _ready = True
+    logger.info("Warm-up finished: %s", timings)
+    return timings
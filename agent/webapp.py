@@ -0,0 +1,41 @@
+"""
+Custom HTTP app mounted by the LangGraph API server (`http.app` in langgraph.json).
+
+Runs the warm-up hook during startup, so the server only starts accepting
+requests once graphs, tool schemas and connection pools are primed, and
+exposes the readiness signal at `/ready`.
+"""
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+import warmup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI): # pylint: disable=unused-argument
+    """
+    Warm up the graphs registered with the LangGraph API before serving.
+    """
+    try:
+        # Warm the exact graph factories the LangGraph API will serve
+        from langgraph_api.graph import GRAPHS
+        factories = {graph_id: factory for graph_id, factory in GRAPHS.items() if callable(factory)}
+    except ImportError:
+        factories = None
+
+    await warmup.run_warmup(factories)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once warm-up has completed, 503 before.
+    """
+    if warmup.is_ready():
+        return {"status": "ready"}
+    return JSONResponse({"status": "warming_up"}, status_code=503)
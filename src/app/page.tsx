@@ -62,8 +62,8 @@ function MainContentWithActions({ themeColor, setThemeColor }: { themeColor: str
 // State of the agent, make sure this aligns with your agent's state.
 type AgentState = {
   proverbs: string[];
-  // Weather state
-  weather_data: {
+  // Weather state: the latest report of every location asked about, keyed by location
+  weather_data: Record<string, {
     location: string;
     temperature: string;
     condition: string;
@@ -77,7 +77,7 @@ type AgentState = {
     recommendations: string[];
     clothing_suggestion: string;
     activity_suggestion: string;
-  } | null;
+  }> | null;
   // HITL (Human-in-the-Loop) state
   hitl_pending: boolean;
   hitl_question: string;